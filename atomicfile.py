@@ -0,0 +1,23 @@
+'''
+Atomic file writes.
+
+Files are written under a temporary name and renamed into place, so concurrent
+readers never see a partial file. The temporary name includes the process and thread
+id, so writers in different processes or threads never share one.
+'''
+import os
+import threading
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb"):
+    '''Opens a temporary file to write; it replaces path on success and is removed on error.'''
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as file:
+            yield file
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
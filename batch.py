@@ -0,0 +1,139 @@
+'''Non-interactive batch runner that solves many dataset problems concurrently.'''
+import asyncio
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_core.messages import AIMessage
+from utils import get_problem_ds
+from graph import reset_thread
+from solver import message_tokens
+
+def count_tokens(values: dict) -> int:
+    '''Sums the tokens reported by the model for every AI message in a state.'''
+    messages = list(values.get("messages") or [])
+    if values.get("candidate") is not None:
+        messages.append(values["candidate"])
+    return sum(message_tokens(message) for message in messages if isinstance(message, AIMessage))
+
+def summarize_run(problem: dict, values: dict, wall_time: float) -> dict:
+    return {
+        "cp_id": problem["title"],
+        "status": values.get("status", "in_progress"),
+        "attempts": sum(isinstance(m, AIMessage) for m in values.get("messages") or []),
+        "tokens": count_tokens(values),
+        "wall_time": round(wall_time, 3),
+    }
+
+def run_problem(graph, problem: dict, trials: int) -> dict:
+    '''Runs the solve/evaluate loop up to trials times without printing or asking for feedback.'''
+    config = {"configurable": {"thread_id": problem["title"], "k": 2}}
+    start = time.perf_counter()
+    reset_thread(graph, problem["title"])
+    stream_state = problem
+    for _ in range(trials):
+        for _ in graph.stream(stream_state, config):
+            pass
+        stream_state = None
+        if graph.get_state(config).values.get("status") == "success":
+            break
+    return summarize_run(problem, graph.get_state(config).values, time.perf_counter() - start)
+
+async def arun_problem(graph, problem: dict, trials: int) -> dict:
+    '''Async version of run_problem driven by graph.astream.'''
+    config = {"configurable": {"thread_id": problem["title"], "k": 2}}
+    start = time.perf_counter()
+    await graph.checkpointer.adelete_thread(problem["title"])
+    stream_state = problem
+    for _ in range(trials):
+        async for _ in graph.astream(stream_state, config):
+            pass
+        stream_state = None
+        if (await graph.aget_state(config)).values.get("status") == "success":
+            break
+    values = (await graph.aget_state(config)).values
+    return summarize_run(problem, values, time.perf_counter() - start)
+
+def load_finished(output_path: str) -> set:
+    '''Returns the cp_ids already recorded in output_path. Errored problems are retried.'''
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by a crash
+            if record.get("status") != "error":
+                finished.add(record["cp_id"])
+    return finished
+
+def error_record(row, start: float) -> dict:
+    return {
+        "cp_id": row["cp_id"],
+        "status": "error",
+        "error": traceback.format_exc(),
+        "wall_time": round(time.perf_counter() - start, 3),
+    }
+
+def run_batch(graph, rows, trials: int, output_path: str, max_concurrency: int = 4) -> list[dict]:
+    '''
+    Solves every dataset row concurrently, one graph thread per problem, and appends a
+    JSON line per problem to output_path as soon as it finishes. Problems already in
+    output_path are skipped, so an interrupted run can simply be started again.
+
+    LLM calls are throttled by the rate limiter on the chat model and test execution by
+    the sandbox pool, so max_concurrency only bounds the number of problems in flight.
+    '''
+    finished = load_finished(output_path)
+    rows = [row for row in rows if row["cp_id"] not in finished]
+    records = []
+
+    def solve_row(row):
+        start = time.perf_counter()
+        try:
+            return run_problem(graph, get_problem_ds(row), trials)
+        except Exception:
+            return error_record(row, start)
+
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(solve_row, row) for row in rows]
+        for future in as_completed(futures):
+            record = future.result()
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            records.append(record)
+            print(f"{record['cp_id']}: {record['status']} ({record['wall_time']}s)")
+    return records
+
+async def arun_batch(graph, rows, trials: int, output_path: str, max_concurrency: int = 16) -> list[dict]:
+    '''
+    Async version of run_batch: every problem is a task on one event loop, with at most
+    max_concurrency in flight. Test execution runs in the default executor, so it never
+    blocks the loop.
+    '''
+    finished = load_finished(output_path)
+    rows = [row for row in rows if row["cp_id"] not in finished]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+    records = []
+
+    async def solve_row(row):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                problem = await loop.run_in_executor(None, get_problem_ds, row)
+                return await arun_problem(graph, problem, trials)
+            except Exception:
+                return error_record(row, start)
+
+    with open(output_path, "a") as output:
+        for task in asyncio.as_completed([solve_row(row) for row in rows]):
+            record = await task
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            records.append(record)
+            print(f"{record['cp_id']}: {record['status']} ({record['wall_time']}s)")
+    return records
@@ -0,0 +1,244 @@
+'''
+Benchmark of the test execution path.
+
+Runs synthetic programs (trivial, CPU-bound, large input, large output, infinite loop,
+crash) through execution.run_test in each sandbox mode at several concurrency levels,
+and reports throughput, latency percentiles, per-test overhead and memory as JSON.
+A few more programs depend on interpreter shutdown (a main thread, atexit, __main__)
+and check that every mode gives the same verdicts as `python -c`. Needs no network,
+dataset or LLM. Compare against an earlier run with --compare to catch regressions:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --compare bench.json
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from execution import run_test
+from sandbox import get_pool
+from testcases import test_case_from_strings
+
+_LARGE_OUTPUT_LINES = 500_000
+_LARGE_INPUT_NUMBERS = 200_000
+_CPU_ITERATIONS = 1_000_000
+
+# name -> (source, stdin, expected stdout, expected verdict prefix, share of --runs)
+PROGRAMS = {
+    "trivial": ("print(int(input()) + 1)", "41\n", "42\n", "passed", 1.0),
+    "cpu_bound": (
+        "n = int(input())\nprint(sum(i * i for i in range(n)))",
+        f"{_CPU_ITERATIONS}\n",
+        f"{sum(i * i for i in range(_CPU_ITERATIONS))}\n",
+        "passed",
+        0.5,
+    ),
+    "large_input": (
+        "import sys\nprint(sum(map(int, sys.stdin.buffer.read().split())))",
+        " ".join(map(str, range(_LARGE_INPUT_NUMBERS))) + "\n",
+        f"{sum(range(_LARGE_INPUT_NUMBERS))}\n",
+        "passed",
+        0.5,
+    ),
+    "large_output": (
+        f"import sys\nsys.stdout.write('1\\n' * {_LARGE_OUTPUT_LINES})",
+        "",
+        "1\n" * _LARGE_OUTPUT_LINES,
+        "passed",
+        0.5,
+    ),
+    "infinite_loop": ("while True:\n    pass", "", "", "timed out", 0.1),
+    "crash": ("raise ValueError('boom')", "", "", "failed", 1.0),
+    # The usual way to get a deep recursion stack; output comes after the module code returns
+    "main_thread": (
+        "import threading\nthreading.stack_size(1 << 26)\n"
+        "def main():\n    print(int(input()) + 1)\nthreading.Thread(target=main).start()",
+        "41\n", "42\n", "passed", 0.25,
+    ),
+    "atexit": ("import atexit\nn = int(input())\natexit.register(lambda: print(n + 1))", "41\n", "42\n", "passed", 0.25),
+    # Test data with Windows line endings is compared as text
+    "crlf": ("print(int(input()) + 1)\nprint(0)", "41\r\n", "42\r\n0\r\n", "passed", 0.25),
+    "buffer_readline": (
+        "import sys\ninput = sys.stdin.buffer.readline\nn = int(input())\nprint(sum(int(input()) for _ in range(n)))",
+        f"{_LARGE_INPUT_NUMBERS}\n" + "1\n" * _LARGE_INPUT_NUMBERS, f"{_LARGE_INPUT_NUMBERS}\n", "passed", 0.25,
+    ),
+    "mixed_stdout": ("import sys\nprint(41)\nsys.stdout.buffer.write(b'42\\n')", "", "41\n42\n", "passed", 0.25),
+    "main_module": ("import __main__\nn = int(input())\nprint(__main__.n + 1)", "41\n", "42\n", "passed", 0.25),
+}
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+def bench_case(name: str, test_case: dict, mode: str, concurrency: int, runs: int, timeout: float) -> dict:
+    source, _, _, expected_verdict, _ = PROGRAMS[name]
+    test = {"input_path": test_case["input_path"], "expected_path": test_case["output_path"]}
+    runs = max(runs, concurrency)
+
+    def one(_):
+        start = time.perf_counter()
+        result = run_test(source, test, timeout, mode=mode)
+        return time.perf_counter() - start, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(runs)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, _ in samples]
+    results = [result for _, result in samples]
+    measured = [result for result in results if result.wall_time is not None]
+    verdicts = Counter(result.verdict.split(":")[0].split(".")[0] for result in results)
+    return {
+        "mode": mode,
+        "program": name,
+        "concurrency": concurrency,
+        "runs": runs,
+        "tests_per_sec": round(runs / elapsed, 2),
+        "p50_ms": _ms(percentile(latencies, 0.5)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "mean_ms": _ms(statistics.fmean(latencies)),
+        # Time the program itself ran, as measured around the child process
+        "program_p50_ms": _ms(percentile([r.wall_time for r in measured], 0.5)) if measured else None,
+        "cpu_p50_ms": _ms(percentile([r.cpu_time for r in measured], 0.5)) if measured else None,
+        # Only measured in pool mode (see execution.exec_program)
+        "max_rss_kib_p50": percentile([r.max_rss for r in measured], 0.5) if measured and mode == "pool" else None,
+        "verdicts": dict(verdicts),
+        "correct": all(result.verdict.startswith(expected_verdict) for result in results),
+    }
+
+def overhead(results: list[dict], mode: str) -> float:
+    '''Fixed cost of one test: the latency of the trivial program, which does almost nothing.'''
+    for row in results:
+        if row["mode"] == mode and row["program"] == "trivial" and row["concurrency"] == 1:
+            return row["p50_ms"]
+    return None
+
+def parity(results: list[dict]) -> list[str]:
+    '''Lists the programs whose verdicts differ between sandbox modes.'''
+    verdicts = {}
+    for row in results:
+        verdicts.setdefault(row["program"], {}).setdefault(row["mode"], set()).update(row["verdicts"])
+    return [
+        f"{program}: " + ", ".join(f"{mode} {sorted(found)}" for mode, found in by_mode.items())
+        for program, by_mode in verdicts.items()
+        if len({frozenset(found) for found in by_mode.values()}) > 1
+    ]
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark(modes, concurrency_levels, runs: int, timeout: float, programs=None) -> dict:
+    programs = programs or list(PROGRAMS)
+    results = []
+    cold_start = {}
+    with tempfile.TemporaryDirectory() as store:
+        test_cases = {
+            name: test_case_from_strings(PROGRAMS[name][1], PROGRAMS[name][2], store)
+            for name in programs
+        }
+        for mode in modes:
+            # The first test also starts the sandbox pool; report it separately
+            start = time.perf_counter()
+            bench_case("trivial", test_case_from_strings("41\n", "42\n", store), mode, 1, 1, timeout)
+            cold_start[mode] = _ms(time.perf_counter() - start)
+            for name in programs:
+                share = PROGRAMS[name][4]
+                for concurrency in concurrency_levels:
+                    row = bench_case(name, test_cases[name], mode, concurrency, max(1, int(runs * share)), timeout)
+                    results.append(row)
+                    print(
+                        f"{mode:<6}{name:<15}c={concurrency:<4}{row['tests_per_sec']:>9.1f} tests/s"
+                        f"{row['p50_ms']:>10.1f} ms p50{row['p99_ms']:>10.1f} ms p99"
+                        f"{'' if row['correct'] else '  WRONG VERDICT ' + str(row['verdicts'])}",
+                        file=sys.stderr,
+                    )
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pool_size": get_pool().size if "pool" in modes else None,
+            "runs": runs,
+            "timeout": timeout,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "summary": {
+            mode: {"overhead_ms": overhead(results, mode), "cold_start_ms": cold_start[mode]}
+            for mode in modes
+        },
+        "parity": parity(results),
+        "memory": {
+            "parent_max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "children_max_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        },
+        "results": results,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    '''Lists the cases whose throughput dropped by more than tolerance against baseline.'''
+    previous = {(r["mode"], r["program"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for row in report["results"]:
+        old = previous.get((row["mode"], row["program"], row["concurrency"]))
+        if old is None or not old["tests_per_sec"]:
+            continue
+        change = row["tests_per_sec"] / old["tests_per_sec"] - 1
+        if change < -tolerance:
+            regressions.append(
+                f"{row['mode']} {row['program']} c={row['concurrency']}: "
+                f"{old['tests_per_sec']} -> {row['tests_per_sec']} tests/s ({change:+.0%})"
+            )
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the sandboxed test execution path.")
+    parser.add_argument("--modes", nargs="+", default=["pool", "spawn"], choices=["pool", "spawn"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16], help="tests in flight")
+    parser.add_argument("--runs", type=int, default=40, help="tests per case (scaled down for slow programs)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="seconds per test")
+    parser.add_argument("--programs", nargs="+", choices=list(PROGRAMS), default=None)
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop for --compare")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    report = run_benchmark(args.modes, args.concurrency, args.runs, args.timeout, args.programs)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    for line in report["parity"]:
+        print(f"modes disagree: {line}", file=sys.stderr)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+    if regressions or report["parity"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Thread-safe LRU cache held in memory, optionally backed by a SQLite file.
+
+    Values are pickled on disk. Entries evicted from memory stay on disk until the
+    file holds more than disk_size entries, so a later process can pick them up.
+    With ttl (seconds), entries older than ttl are treated as missing and dropped.
+    """
+
+    _TRIM_EVERY = 256  # inserts between trims of the SQLite table
+
+    def __init__(self, max_size: int, path: str = None, disk_size: int = None, ttl: float = None):
+        self.max_size = max_size
+        self.disk_size = disk_size or max_size
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._inserts = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB, last_access REAL, created REAL)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(cache)")]
+            if "created" not in columns:
+                # Files written before TTL support; their entries count as created now
+                self._db.execute("ALTER TABLE cache ADD COLUMN created REAL")
+                self._db.execute("UPDATE cache SET created = ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key in self._memory:
+                value, created = self._memory[key]
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+            if self._db is None:
+                return default
+            row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            if self._expired(row[1]):
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._db.commit()
+                return default
+            self._db.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            value = pickle.loads(row[0])
+            self._remember(key, value, row[1])
+            return value
+
+    def set(self, key: str, value):
+        with self._lock:
+            now = time.time()
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, last_access, created) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now, now),
+            )
+            self._inserts += 1
+            if self._inserts % self._TRIM_EVERY == 0:
+                self._trim()
+            self._db.commit()
+
+    def _remember(self, key, value, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and created is not None and time.time() - created > self.ttl
+
+    def _trim(self):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,),
+        )
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._db is None:
+                return len(self._memory)
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+_MISSING = object()
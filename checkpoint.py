@@ -0,0 +1,340 @@
+'''
+Disk-backed LangGraph checkpointer for long sessions and batch runs.
+
+Like MemorySaver, a checkpoint only stores the channels whose version changed in that
+step, so each step writes a delta. Channel values are split into content-addressed
+objects, each stored once: a list channel such as messages is saved as the hashes of
+its elements, so a step that appends one message writes one new object rather than
+the whole history again, and identical values (examples, test cases) are shared
+across steps and threads. The latest checkpoint of every thread is kept in its own
+table, so reading the current state is a single-row lookup. Each thread records the
+objects it uses, so deleting a thread also deletes the objects no other thread uses;
+SQLite reuses the freed pages for later writes.
+'''
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY, type TEXT, data BLOB
+);
+CREATE TABLE IF NOT EXISTS object_refs (
+    thread_id TEXT, hash TEXT,
+    PRIMARY KEY (thread_id, hash)
+);
+CREATE INDEX IF NOT EXISTS object_refs_hash ON object_refs (hash);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT,
+    checkpoint TEXT, metadata TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS channel_values (
+    thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT, manifest TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+    channel TEXT, object TEXT, task_path TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns)
+);
+"""
+
+class SqliteDeltaSaver(BaseCheckpointSaver[str]):
+    """Checkpointer that stores per-step channel deltas as deduplicated objects in SQLite."""
+
+    def __init__(self, path: str, *, serde=None):
+        super().__init__(serde=serde)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+    def _put_object(self, value, thread_id: str) -> str:
+        type_, data = self.serde.dumps_typed(value)
+        digest = hashlib.sha256(type_.encode() + b"\0" + data).hexdigest()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO objects (hash, type, data) VALUES (?, ?, ?)", (digest, type_, data)
+        )
+        self.conn.execute("INSERT OR IGNORE INTO object_refs VALUES (?, ?)", (thread_id, digest))
+        return digest
+
+    def _get_object(self, digest: str):
+        type_, data = self.conn.execute(
+            "SELECT type, data FROM objects WHERE hash = ?", (digest,)
+        ).fetchone()
+        return self.serde.loads_typed((type_, data))
+
+    def _dump_value(self, value, thread_id: str) -> str:
+        if type(value) is list:
+            return json.dumps({"list": [self._put_object(item, thread_id) for item in value]})
+        return json.dumps({"value": self._put_object(value, thread_id)})
+
+    def _load_value(self, manifest: str):
+        manifest = json.loads(manifest)
+        if "list" in manifest:
+            return [self._get_object(digest) for digest in manifest["list"]]
+        return self._get_object(manifest["value"])
+
+    def _load_channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        values = {}
+        for channel, version in versions.items():
+            row = self.conn.execute(
+                "SELECT manifest FROM channel_values "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is not None and row[0] is not None:
+                values[channel] = self._load_value(row[0])
+        return values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = self.conn.execute(
+            "SELECT task_id, idx, channel, object, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        rows.sort(key=lambda row: writes_sort_key(row[4], row[0], row[1]))
+        return [(task_id, channel, self._get_object(obj)) for task_id, _, channel, obj, _ in rows]
+
+    def _tuple(self, thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata) -> CheckpointTuple:
+        checkpoint = self._get_object(checkpoint)
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(
+                    thread_id, checkpoint_ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self._get_object(metadata),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.lock:
+            checkpoint_id = get_checkpoint_id(config)
+            if not checkpoint_id:
+                row = self.conn.execute(
+                    "SELECT checkpoint_id FROM latest WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+                if row is None:
+                    return None
+                checkpoint_id = row[0]
+            row = self.conn.execute(
+                "SELECT parent_id, checkpoint, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+            if row is None:
+                return None
+            return self._tuple(thread_id, checkpoint_ns, checkpoint_id, *row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self.lock:
+                if filter:
+                    metadata = self._get_object(row[5])
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                item = self._tuple(*row)
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        with self.lock, self.conn:
+            # Only channels updated in this step are written; the rest are found by version
+            for channel, version in new_versions.items():
+                manifest = self._dump_value(values[channel], thread_id) if channel in values else None
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO channel_values VALUES (?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, channel, str(version), manifest),
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    self._put_object(c, thread_id),
+                    self._put_object(get_checkpoint_metadata(config, metadata), thread_id),
+                ),
+            )
+            self.conn.execute(
+                "INSERT INTO latest VALUES (?, ?, ?) ON CONFLICT (thread_id, checkpoint_ns) "
+                "DO UPDATE SET checkpoint_id = excluded.checkpoint_id "
+                "WHERE excluded.checkpoint_id > latest.checkpoint_id",
+                (thread_id, checkpoint_ns, checkpoint["id"]),
+            )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self.lock, self.conn:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                # Regular writes keep the first value stored; special ones (errors, interrupts) overwrite
+                verb = "INSERT OR IGNORE" if idx >= 0 else "INSERT OR REPLACE"
+                self.conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel,
+                        self._put_object(value, thread_id), task_path,
+                    ),
+                )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock, self.conn:
+            for table in ("checkpoints", "channel_values", "writes", "latest"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            # Objects shared with another thread stay until that thread is deleted too
+            self.conn.execute(
+                "DELETE FROM objects WHERE hash IN (SELECT hash FROM object_refs WHERE thread_id = ?) "
+                "AND NOT EXISTS (SELECT 1 FROM object_refs r WHERE r.hash = objects.hash AND r.thread_id != ?)",
+                (thread_id, thread_id),
+            )
+            self.conn.execute("DELETE FROM object_refs WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Same scheme as MemorySaver: zero-padded counter plus a random suffix
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
@@ -1,7 +1,67 @@
+import os
+
 OPENAI_API_KEY='your_openai_api_key'
 LANGCHAIN_API_KEY='your_langchain_api_key'
 ANTHROPIC_API_KEY='your_anthropic_api_key'
 
 usaco_url = "https://storage.googleapis.com/benchmarks-artifacts/usaco/usaco_sampled_with_tests.zip"
 zip_path = "usaco.zip"
-extract_path = "usaco_datasets"
\ No newline at end of file
+extract_path = "usaco_datasets"
+
+# Test execution
+max_eval_workers = os.cpu_count() or 1  # test cases run concurrently per evaluate call
+eval_fail_fast = False  # stop scheduling tests once one fails (remaining tests report "skipped")
+sandbox_mode = "pool"  # "pool" reuses warm sandbox interpreters, "spawn" starts a fresh one per test
+sandbox_max_runs = 200  # jobs a sandbox worker serves before it is recycled
+compile_cache_size = 256  # compiled candidates kept in memory, keyed by source hash
+verdict_cache_size = 100000  # cached test verdicts kept in memory
+execution_backend = "local"  # "local" runs tests here; "queue" sends them to jobqueue.py workers
+broker_address = "127.0.0.1:8765"  # job queue broker (python jobqueue.py broker)
+queue_lease_grace = 10  # seconds past a test's timeout before a silent worker's job is retried
+queue_max_attempts = 3  # workers a job may be lost on before it fails
+queue_wait_timeout = 600  # seconds a job may wait for workers before it fails
+queue_store_path = "queue_store"  # test files held by the broker and downloaded by workers
+queue_token = os.environ.get("QUEUE_TOKEN", "")  # shared secret every broker connection must present
+queue_max_upload = 256 * 2**20  # largest test (input plus output, in bytes) a client may upload
+verdict_cache_path = None  # e.g. "cache/verdicts.sqlite" to persist verdicts across runs
+default_timeout = 2  # seconds per test when the problem has no runtime_limit
+max_timeout = 10  # cap on runtime_limit so one evaluation cannot stall a run
+
+# Retrieval
+index_path = "usaco_index"  # prebuilt example index, memory-mapped at startup (delete to rebuild)
+retrieval_backend = "bm25"  # "bm25", "tfidf" (hashed TF-IDF embeddings) or "hybrid"
+retrieval_alpha = 0.5  # weight of BM25 in the hybrid backend
+
+# LLM
+llm_provider = "anthropic"  # "anthropic", "openai" or "stub"; only the chosen SDK is imported
+prompt_cache_path = "cache/usaco-draft-solver.json"  # local copy of the hub prompt, pulled on first run
+llm_requests_per_second = 1  # shared rate limit for all model calls, independent of sandbox concurrency
+llm_cache_mode = "off"  # "record" answers repeated prompts from cache, "replay" never calls the model (also --llm-cache)
+llm_cache_path = "cache/llm.sqlite"  # recorded responses, keyed by model and prompt
+llm_cache_size = 10000  # responses kept in memory (and on disk)
+llm_cache_ttl = None  # seconds before a recorded response expires; None keeps them until evicted
+context_token_budget = 8000  # estimated tokens of conversation sent per call; the latest attempt is always kept in full
+context_old_chars = 400  # characters kept per field of an earlier attempt's messages
+output_preview_limit = 2000  # characters of expected/actual output quoted in wrong-answer feedback
+usaco_tests_path = "/Users/stevenyu/programmingsolver/usaco_data/datasets/usaco_v3/tests/"  # I.n/O.n files per cp_id
+test_store_path = "test_store"  # content-addressed files for test cases entered by hand
+
+# Checkpointing
+checkpoint_path = "checkpoints.sqlite"  # delta-based SQLite checkpointer; None keeps everything in memory (MemorySaver)
+
+# Instrumentation
+trace_path = None  # e.g. "traces/run.json" to record a Chrome trace and a summary table (also --trace)
+
+# Evaluation
+evaluation_mode = "staged"  # "full" runs every test; "staged" runs the sample and smallest tests first;
+# "incremental" reruns the tests the previous attempt failed before the rest (staged on the first attempt)
+test_history_size = 5  # code versions whose per-test results are kept in the state (incremental mode reads the last)
+num_candidates = 1  # candidates sampled concurrently per solve step; the best one is kept
+staged_first_tier = 2  # tests in the first stage (the sample test plus the smallest inputs)
+
+# Stress testing (runs once the fixed tests pass, if the problem has a generator and reference)
+stress_store_path = "stress_store"  # generated inputs and reference outputs, cached by content hash
+stress_max_n = 100000  # largest generated input size when the problem does not give one
+stress_points = 5  # input sizes, each 4x the previous one, up to the maximum
+stress_seed = 0  # passed to the generator so inputs are reproducible
+stress_reference_timeout = 30  # seconds allowed to the generator and the reference per input
@@ -0,0 +1,126 @@
+'''
+Size-bounded conversation context for the solve loop.
+
+The graph state keeps every attempt, but the model only needs the latest one in full.
+Older attempts are condensed (long text cut down, test dumps reduced to the pass rate
+and first failure) and, if the context is still over budget, dropped oldest first.
+Condensed messages are memoized by message id, so each one is processed once no
+matter how many retries follow, and the prompt prefix rendered with the retrieved
+examples is built once per problem.
+'''
+import re
+import threading
+from collections import OrderedDict
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from config import context_token_budget, context_old_chars
+
+_MEMO_SIZE = 4096
+
+_condensed = OrderedDict()
+_condensed_lock = threading.Lock()
+
+def estimate_tokens(message: BaseMessage) -> int:
+    # About four characters per token is close enough to decide what to cut
+    size = len(_text(message.content))
+    for call in getattr(message, "tool_calls", None) or []:
+        size += sum(len(str(value)) for value in call["args"].values())
+    return size // 4 + 1
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def truncate(text: str, limit: int) -> str:
+    '''Keeps the start and end of text, which hold the most useful parts of code and logs.'''
+    if len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    tail = limit - head
+    return f"{text[:head]}\n... [{len(text) - limit} characters omitted] ...\n{text[-tail:]}"
+
+def _condense_results(content: str, limit: int) -> str:
+    # Feedback from evaluate: keep the pass rate and the first test that did not pass
+    pass_rate = re.search(r"Pass rate: \d+/\d+", content)
+    failures = [
+        (test_id, result)
+        for test_id, result in re.findall(r"<test id=(\d+)>\n(.*?)\n</test>", content, re.DOTALL)
+        if result != "passed"
+    ]
+    if not pass_rate or not failures:
+        return truncate(content, limit)
+    test_id, result = failures[0]
+    return f"Earlier attempt. {pass_rate.group(0)}. First failure, test {test_id}: {truncate(result, limit)}"
+
+def condense(message: BaseMessage, limit: int = context_old_chars) -> BaseMessage:
+    '''Returns a shortened copy of a message from an earlier attempt.'''
+    key = (message.id, limit)
+    if message.id is not None:
+        with _condensed_lock:
+            if key in _condensed:
+                _condensed.move_to_end(key)
+                return _condensed[key]
+    if isinstance(message, ToolMessage):
+        condensed = message.model_copy(update={"content": _condense_results(_text(message.content), limit)})
+    elif isinstance(message, AIMessage):
+        tool_calls = [
+            {**call, "args": {name: truncate(str(value), limit) for name, value in call["args"].items()}}
+            for call in message.tool_calls
+        ]
+        condensed = message.model_copy(update={"content": truncate(_text(message.content), limit), "tool_calls": tool_calls})
+    else:
+        condensed = message.model_copy(update={"content": truncate(_text(message.content), limit)})
+    if message.id is not None:
+        with _condensed_lock:
+            _condensed[key] = condensed
+            while len(_condensed) > _MEMO_SIZE:
+                _condensed.popitem(last=False)
+    return condensed
+
+def compact_messages(
+    messages: list[BaseMessage], budget: int = context_token_budget, limit: int = context_old_chars
+) -> list[BaseMessage]:
+    '''
+    Fits a conversation into about budget tokens. Messages before the first AI message
+    (the problem statement) and the latest attempt, from the last AI message on, are kept
+    in full. Earlier attempts are condensed and then dropped oldest first. An attempt is
+    an AI message with everything up to the next one, so tool calls always stay paired
+    with their results.
+    '''
+    starts = [i for i, message in enumerate(messages) if isinstance(message, AIMessage)]
+    if len(starts) < 2:
+        return list(messages)
+    head = list(messages[:starts[0]])
+    latest = list(messages[starts[-1]:])
+    attempts = [
+        [condense(message, limit) for message in messages[start:end]]
+        for start, end in zip(starts, starts[1:])
+    ]
+    used = sum(estimate_tokens(message) for message in head + latest)
+    sizes = [sum(estimate_tokens(message) for message in attempt) for attempt in attempts]
+    dropped = 0
+    while attempts and used + sum(sizes) > budget:
+        attempts.pop(0)
+        sizes.pop(0)
+        dropped += 1
+    if dropped:
+        head.append(HumanMessage(content=f"({dropped} earlier attempts omitted.)"))
+    return head + [message for attempt in attempts for message in attempt] + latest
+
+def render_prefix(prompt: ChatPromptTemplate, **variables) -> ChatPromptTemplate:
+    '''
+    Formats every message of prompt except the placeholders, so the fixed part of the
+    prompt (instructions and retrieved examples) is rendered once rather than every turn.
+    '''
+    variables = {**prompt.partial_variables, **variables}
+    messages = []
+    for template in prompt.messages:
+        if isinstance(template, (BaseMessage, MessagesPlaceholder)) or any(
+            name not in variables for name in template.input_variables
+        ):
+            messages.append(template)
+        else:
+            values = {name: variables[name] for name in template.input_variables}
+            messages.extend(template.format_messages(**values))
+    return ChatPromptTemplate.from_messages(messages)
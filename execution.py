@@ -1,57 +1,443 @@
+import hashlib
+import io
+import marshal
 import multiprocessing
+import os
 import queue
 import subprocess
 import sys
-import time
+import threading
+import tokenize
 import traceback
-from utils import filter_python_code
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple, Union
+from config import (
+    max_eval_workers, eval_fail_fast, sandbox_mode, execution_backend, compile_cache_size,
+    verdict_cache_size, verdict_cache_path, output_preview_limit, staged_first_tier,
+)
+from cache import LRUCache
+from sandbox import (
+    OutputComparator, SandboxError, close_expected, communicate, get_pool, load_expected, open_input,
+    set_limits,
+)
+from instrument import tracer
+from models import TestCase
+from testcases import as_test_case, normalize_newlines, test_case_from_strings
 
 # Set multiprocessing start method
 multiprocessing.set_start_method("fork", force=True)
 
-def exec_program(q, program, input_data, expected_output, timeout):
+class CompiledProgram(NamedTuple):
+    source: str
+    digest: str  # sha256 of the source
+    code: bytes  # marshalled code object, loaded directly by the sandbox workers
+
+_compiled_programs = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def compile_program(program: str) -> CompiledProgram:
+    """
+    Compiles a candidate once and caches it by content hash.
+
+    Raises SyntaxError (or ValueError for null bytes) without spawning anything.
+    """
+    digest = hashlib.sha256(program.encode()).hexdigest()
+    with _compiled_lock:
+        compiled = _compiled_programs.get(digest)
+        if compiled is not None:
+            _compiled_programs.move_to_end(digest)
+            return compiled
+    compiled = CompiledProgram(program, digest, marshal.dumps(compile(program, "<string>", "exec")))
+    with _compiled_lock:
+        _compiled_programs[digest] = compiled
+        while len(_compiled_programs) > compile_cache_size:
+            _compiled_programs.popitem(last=False)
+    return compiled
+
+class TestResult(NamedTuple):
+    verdict: str  # "passed", "timed out", "failed: ..." or "wrong answer. ..."
+    wall_time: float = None  # seconds; None when the program never ran
+    cpu_time: float = None  # user + system seconds
+    max_rss: int = None  # peak resident set size in KiB; None when not measured (spawn mode)
+
+def format_compile_error(e: Exception) -> TestResult:
+    # Same text `python -c` prints to stderr for an uncompilable program
+    return TestResult("failed: " + "".join(traceback.format_exception_only(type(e), e)))
+
+def format_result(result: dict) -> TestResult:
+    """Turns a raw sandbox result into the verdict fed back to the model, with its resource usage."""
+    return TestResult(format_verdict(result), result["wall_time"], result["cpu_time"], result["max_rss"])
+
+def format_verdict(result: dict) -> str:
+    if result["timed_out"]:
+        return "timed out"
+    if not result["diverged"] and result["returncode"] != 0:
+        return f"failed: {result['stderr'].decode(errors='replace')}"
+    if result["matched"]:
+        return "passed"
+    # Only bounded previews are shown; the comparison itself already saw everything
+    got = result["stdout_preview"].decode(errors="replace")
+    if result["stdout_size"] > len(result["stdout_preview"]):
+        got += "..."
+    expected = result["expected_preview"].decode(errors="replace")
+    if result["expected_size"] > len(result["expected_preview"]):
+        expected += "..."
+    line, column = result["mismatch"]
+    return f"wrong answer. Expected '{expected}', got '{got}'\nFirst difference at line {line}, column {column}."
+
+def exec_program(q, program, test, timeout, memory_limit=None):
     try:
-        start_time = time.time()
+        expected = load_expected(test)
+        stdin_fd, feed = open_input(test)
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
         process = subprocess.Popen(
             [sys.executable, "-c", program],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+            stdin=stdin_fd,
+            stdout=stdout_w,
+            stderr=stderr_w,
+            start_new_session=True,
+            preexec_fn=lambda: set_limits(timeout, memory_limit),
         )
-        stdout, stderr = process.communicate(input=input_data, timeout=timeout)
-        if time.time() - start_time > timeout:
-            raise TimeoutError("Execution timed out.")
-        if process.returncode != 0:
-            q.put(f"failed: {stderr}")
-        else:
-            if stdout.strip() == expected_output.strip():
-                q.put("passed")
-            else:
-                q.put(f"wrong answer. Expected '{expected_output}', got '{stdout}'")
-    except subprocess.TimeoutExpired:
-        process.kill()
-        q.put("timed out")
+        for fd in (stdin_fd, stdout_w, stderr_w):
+            os.close(fd)
+        comparator = OutputComparator(expected, output_preview_limit)
+        result = communicate(process.pid, stdout_r, stderr_r, feed, timeout, comparator)
+        close_expected(expected)
+        # The child is forked from this process before exec, and wait4 reports the larger
+        # of the two peaks, so its peak memory would be this process's
+        result["max_rss"] = None
+        q.put(format_result(result))
     except Exception:
-        q.put(f"failed: {traceback.format_exc()}")
+        q.put(TestResult(f"failed: {traceback.format_exc()}"))
 
-def check_correctness(
-    program: str, input_data: str, expected_output: str, timeout: float
-) -> str:
-    filtered_program = filter_python_code(program)
+SANDBOX_FAILURE = "failed: sandbox error: "
+
+def run_test(
+    program: Union[str, CompiledProgram], test: dict, timeout: float, memory_limit: int = None,
+    mode: str = sandbox_mode,
+) -> TestResult:
+    """
+    Runs one test and returns its verdict and resource usage. test holds either "input"
+    or "input_path" and either "expected" or "expected_path" (see SandboxPool.run).
+    memory_limit is in MB. mode is "pool" or "spawn" (see sandbox_mode in config.py).
+    """
+    if mode == "pool":
+        if isinstance(program, str):
+            try:
+                program = compile_program(program)
+            except (SyntaxError, ValueError) as e:
+                return format_compile_error(e)
+        try:
+            result = get_pool().run(
+                program.digest, program.code, test, timeout, memory_limit, output_preview_limit
+            )
+        except SandboxError as e:
+            return TestResult(f"{SANDBOX_FAILURE}{e}")
+        return format_result(result)
+    if isinstance(program, CompiledProgram):
+        program = program.source
     q = multiprocessing.Queue()
-    process = multiprocessing.Process(
-        target=exec_program, args=(q, program, input_data, expected_output, timeout)
-    )
+    process = multiprocessing.Process(target=exec_program, args=(q, program, test, timeout, memory_limit))
     process.start()
     process.join(timeout=timeout + 1)
     if process.is_alive():
         process.terminate()
         process.join()
-        result = "timed out"
+        result = TestResult("timed out")
     else:
         try:
             result = q.get_nowait()
         except queue.Empty:
-            result = "no result returned"
-    return result 
\ No newline at end of file
+            result = TestResult("no result returned")
+    return result
+
+def check_correctness(
+    program: Union[str, CompiledProgram], input_data: str, expected_output: str, timeout: float
+) -> str:
+    if execution_backend == "queue":
+        # Remote workers need a content-addressed test they can download
+        return check_test_case(program, test_case_from_strings(input_data, expected_output), timeout).verdict
+    test = {"input": normalize_newlines(input_data).encode(), "expected": normalize_newlines(expected_output).encode()}
+    return run_test(program, test, timeout).verdict
+
+def check_test_case(
+    program: Union[str, CompiledProgram], test_case: TestCase, timeout: float, memory_limit: int = None
+) -> TestResult:
+    """
+    Runs a file-backed test case; the sandbox reads its files directly. With the "queue"
+    execution backend the test runs on a remote worker instead (see jobqueue.py).
+    """
+    test = {"input_path": test_case["input_path"], "expected_path": test_case["output_path"]}
+    with tracer.span("test", "sandbox", digest=test_case["digest"][:12], input_size=test_case["input_size"]) as span:
+        if execution_backend == "queue":
+            result = run_remote(program, test_case, timeout, memory_limit)
+        else:
+            result = run_test(program, test, timeout, memory_limit)
+        span.set(
+            verdict=result.verdict.split(".")[0][:40],
+            wall_time=result.wall_time,
+            cpu_time=result.cpu_time,
+            max_rss=result.max_rss,
+        )
+    return result
+
+def run_remote(
+    program: Union[str, CompiledProgram], test_case: TestCase, timeout: float, memory_limit: int = None
+) -> TestResult:
+    # Imported here because jobqueue runs this module's run_test on the workers
+    from jobqueue import get_client
+    source = program.source if isinstance(program, CompiledProgram) else program
+    digest = program.digest if isinstance(program, CompiledProgram) else hashlib.sha256(source.encode()).hexdigest()
+    try:
+        return TestResult(**get_client().run(source, digest, test_case, timeout, memory_limit))
+    except (EOFError, OSError) as e:
+        return TestResult(f"{SANDBOX_FAILURE}job queue unavailable: {e!r}")
+
+# Results keyed by (program, test case, timeout, memory limit); see run_test_cases
+verdict_cache = LRUCache(verdict_cache_size, verdict_cache_path)
+
+_STRING_TOKENS = {tokenize.STRING, getattr(tokenize, "FSTRING_MIDDLE", tokenize.STRING)}
+
+def normalize_program(program: str) -> str:
+    """
+    Drops comments, blank lines and trailing whitespace outside string literals, none of
+    which change what a program does. Lines that end inside a string or continue with a
+    backslash are kept exactly.
+    """
+    program = program.replace("\r\n", "\n")
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(program).readline))
+    except (tokenize.TokenError, SyntaxError):
+        # Fails to compile either way; only trailing blank lines are safe to drop
+        return program.rstrip("\n")
+    verbatim = set()  # 1-based rows whose line break is inside a string
+    comments = {}  # row -> column where its comment starts
+    for token in tokens:
+        if token.type == tokenize.COMMENT:
+            comments[token.start[0]] = token.start[1]
+        elif token.type in _STRING_TOKENS and token.end[0] > token.start[0]:
+            verbatim.update(range(token.start[0], token.end[0]))
+    lines = []
+    continued = False
+    for row, line in enumerate(program.split("\n"), 1):
+        if row in verbatim or continued:
+            lines.append(line)
+            continued = line.endswith("\\") and row not in verbatim
+            continue
+        code = line[:comments.get(row, len(line))]
+        continued = code.rstrip().endswith("\\")
+        if continued:
+            lines.append(line)
+        elif code.strip():
+            lines.append(code.rstrip())
+    return "\n".join(lines)
+
+def program_digest(program: str) -> str:
+    return hashlib.sha256(normalize_program(program).encode()).hexdigest()
+
+def _verdict_key(kind: str, digest: str, test_case: TestCase, timeout: float, memory_limit: int = None) -> str:
+    return f"{kind}:{digest}:{test_case['digest']}:{timeout!r}:{memory_limit!r}"
+
+def _is_outcome(result: TestResult) -> bool:
+    # Infrastructure failures say nothing about the program, so they are retried
+    return not result.verdict.startswith(SANDBOX_FAILURE) and result.verdict != "no result returned"
+
+def _cacheable(result: TestResult) -> bool:
+    # Whether a timeout happens depends on how busy the machine was
+    return _is_outcome(result) and result.verdict != "timed out"
+
+def _portable(result: TestResult) -> bool:
+    # Output is the same for every normalized variant of a program, but tracebacks and
+    # syntax errors quote line numbers and source text, which differ between them
+    return result.verdict == "passed" or result.verdict.startswith("wrong answer")
+
+# Test digest -> [runs, failures] over every program evaluated by this process
+_test_history = {}
+_test_history_lock = threading.Lock()
+
+def _record_outcome(test_case: TestCase, passed: bool):
+    with _test_history_lock:
+        counts = _test_history.setdefault(test_case["digest"], [0, 0])
+        counts[0] += 1
+        counts[1] += not passed
+
+def failure_rate(test_case: TestCase) -> float:
+    # Smoothed so tests that have never run rank in the middle
+    with _test_history_lock:
+        runs, failures = _test_history.get(test_case["digest"], (0, 0))
+    return (failures + 1) / (runs + 2)
+
+def order_tests(test_cases: list[TestCase], indices: list[int]) -> list[int]:
+    """Orders test indices so that the likeliest failures and the cheapest inputs run first."""
+    return sorted(indices, key=lambda i: (-failure_rate(test_cases[i]), test_cases[i]["input_size"]))
+
+def run_test_cases(
+    program: str,
+    test_cases: list,
+    timeout: float,
+    max_workers: int = max_eval_workers,
+    fail_fast: bool = eval_fail_fast,
+    memory_limit: int = None,
+) -> list[TestResult]:
+    """
+    Runs every test case against the program on a bounded worker pool.
+
+    Results are returned in test case order. Results already recorded for the same
+    program, test case, timeout and memory limit are returned from verdict_cache without
+    running anything. Passes and wrong answers are shared by every variant of a program
+    that differs only in comments and whitespace (see normalize_program); other failures
+    only by the exact source. Timeouts are never cached. With fail_fast, tests that have
+    not started by the time one fails are cancelled and reported as skipped.
+    """
+    results = [TestResult("skipped (an earlier test failed)")] * len(test_cases)
+    if not test_cases:
+        return results
+    test_cases = [as_test_case(test_case) for test_case in test_cases]
+    normalized, exact = program_digest(program), hashlib.sha256(program.encode()).hexdigest()
+    keys = [
+        (
+            _verdict_key("normalized", normalized, test_case, timeout, memory_limit),
+            _verdict_key("exact", exact, test_case, timeout, memory_limit),
+        )
+        for test_case in test_cases
+    ]
+    pending = []
+    cached_failure = False
+    for i, (normalized_key, exact_key) in enumerate(keys):
+        cached = verdict_cache.get(normalized_key) or verdict_cache.get(exact_key)
+        if cached is None:
+            pending.append(i)
+        else:
+            results[i] = cached
+            cached_failure = cached_failure or cached.verdict != "passed"
+    if not pending or (fail_fast and cached_failure):
+        return results
+    # Compile once for all test cases; a syntax error fails every test without running any
+    try:
+        program = compile_program(program)
+    except (SyntaxError, ValueError) as e:
+        for i in pending:
+            results[i] = format_compile_error(e)
+            verdict_cache.set(keys[i][1], results[i])
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        futures = {
+            executor.submit(check_test_case, program, test_cases[i], timeout, memory_limit): i
+            for i in pending
+        }
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            i = futures[future]
+            results[i] = future.result()
+            if _cacheable(results[i]):
+                verdict_cache.set(keys[i][0 if _portable(results[i]) else 1], results[i])
+            if _is_outcome(results[i]):
+                _record_outcome(test_cases[i], results[i].verdict == "passed")
+            if fail_fast and results[i].verdict != "passed":
+                for queued in futures:
+                    queued.cancel()
+    return results
+
+def run_staged(
+    program: str,
+    test_cases: list,
+    timeout: float,
+    first_tier: int = staged_first_tier,
+    **kwargs,
+) -> list[TestResult]:
+    """
+    Runs a cheap first tier (the sample test plus the smallest inputs) and only moves on
+    to the rest of the suite if every test in it passes. The remaining tests are ordered
+    by order_tests and stop being scheduled at the first failure, so the likeliest
+    failures end the evaluation early. Tests that are never run are reported as skipped.
+    """
+    if not test_cases:
+        return []
+    test_cases = [as_test_case(test_case) for test_case in test_cases]
+    # Test 0 is the sample from the statement in USACO problems
+    by_size = sorted(range(1, len(test_cases)), key=lambda i: test_cases[i]["input_size"])
+    tiers = [[0] + by_size[:max(0, first_tier - 1)], order_tests(test_cases, by_size[max(0, first_tier - 1):])]
+    return _run_tiers(program, test_cases, tiers, timeout, **kwargs)
+
+def run_incremental(
+    program: str,
+    test_cases: list,
+    timeout: float,
+    previous: dict[str, bool] = None,
+    **kwargs,
+) -> list[TestResult]:
+    """
+    Re-evaluates a fixed program against what its previous version did. The tests the
+    previous version failed run first; only if they all pass now do the remaining tests
+    run as a regression check, cheapest first. previous maps test digests to whether the
+    previous version passed them. Without it this is run_staged.
+    """
+    if not previous:
+        return run_staged(program, test_cases, timeout, **kwargs)
+    if not test_cases:
+        return []
+    test_cases = [as_test_case(test_case) for test_case in test_cases]
+    by_size = sorted(range(len(test_cases)), key=lambda i: test_cases[i]["input_size"])
+    failed = [i for i in by_size if previous.get(test_cases[i]["digest"]) is False]
+    # Tests the previous version passed or never reached
+    rest = [i for i in by_size if previous.get(test_cases[i]["digest"]) is not False]
+    return _run_tiers(program, test_cases, [failed, rest], timeout, **kwargs)
+
+def record_results(test_cases: list, results: list[TestResult]) -> dict[str, bool]:
+    """Maps the digest of every test that actually ran to whether it passed."""
+    return {
+        as_test_case(test_case)["digest"]: result.verdict == "passed"
+        for test_case, result in zip(test_cases, results)
+        if _is_outcome(result) and not result.verdict.startswith("skipped")
+    }
+
+def _run_tiers(program: str, test_cases: list[TestCase], tiers: list[list[int]], timeout: float, **kwargs):
+    # Each tier runs only if every test in the tiers before it passed. The first tier runs
+    # in full so the model sees all of its results; later tiers stop at their first failure
+    results = [TestResult("skipped (an earlier stage failed)")] * len(test_cases)
+    for n, tier in enumerate(tiers):
+        if not tier:
+            continue
+        fail_fast = kwargs.get("fail_fast", eval_fail_fast) or n > 0
+        tier_results = run_test_cases(
+            program, [test_cases[i] for i in tier], timeout, **{**kwargs, "fail_fast": fail_fast}
+        )
+        for i, result in zip(tier, tier_results):
+            results[i] = result
+        if any(result.verdict != "passed" for result in tier_results):
+            break
+    return results
+
+def _classify_timeout(result: TestResult) -> str:
+    # Stdin is a file or a closed pipe, so a program never waits for input. Little CPU
+    # time means it was sleeping or, more often, sharing the CPU with other tests
+    if result.cpu_time is None or result.wall_time is None:
+        return "timed out"
+    if result.cpu_time >= 0.5 * result.wall_time:
+        return "timed out while CPU-bound: too slow or an infinite loop"
+    return "timed out with little CPU time used: the machine was busy or the program was sleeping"
+
+def format_performance(results: list[TestResult], timeout: float, limit: int = 3) -> str:
+    """
+    Summarizes how close the slowest tests came to the time limit, so the model can tell
+    a program that is slightly too slow from one that is asymptotically wrong.
+    """
+    measured = [(i, r) for i, r in enumerate(results) if r.wall_time is not None]
+    if not measured:
+        return ""
+    measured.sort(key=lambda item: item[1].wall_time, reverse=True)
+    lines = [f"Slowest tests (time limit {timeout:g}s):"]
+    for i, result in measured[:limit]:
+        line = (
+            f"Test id={i}: {result.wall_time:.2f}s wall, {result.cpu_time:.2f}s CPU "
+            f"({result.wall_time / timeout:.0%} of limit)"
+        )
+        if result.max_rss is not None:
+            line += f", peak memory {result.max_rss / 1024:.1f} MB"
+        if result.verdict == "timed out":
+            line += f", {_classify_timeout(result)}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -1,17 +1,39 @@
 from langgraph.graph import END, StateGraph, START
 from langgraph.checkpoint.memory import MemorySaver
+from checkpoint import SqliteDeltaSaver
+from config import checkpoint_path
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+from instrument import tracer
 from models import State
-from solver import Solver, evaluate
-from retrieval import retrieve_examples
+from solver import Solver, evaluate, aevaluate
+from retrieval import retrieve_examples, aretrieve_examples
 
-def build_graph(draft_solver, solver):
+def traced_node(name: str, func, afunc) -> RunnableLambda:
+    '''Wraps a node's sync and async implementations in a tracer span.'''
+    def call(f, state, config):
+        return f(state, config) if accepts_config(f) else f(state)
+
+    def wrapper(state: State, config: RunnableConfig):
+        with tracer.span(name, "node", thread_id=config["configurable"].get("thread_id")):
+            return call(func, state, config)
+
+    async def awrapper(state: State, config: RunnableConfig):
+        with tracer.span(name, "node", thread_id=config["configurable"].get("thread_id")):
+            return await call(afunc, state, config)
+
+    return RunnableLambda(wrapper, afunc=awrapper, name=name)
+
+def build_graph(draft_solver, solver, checkpointer=None):
     builder = StateGraph(State)
 
-    builder.add_node("draft", draft_solver)
+    # Each node has a sync and an async implementation so the graph works with both
+    # stream/invoke and astream/ainvoke
+    builder.add_node("draft", traced_node("draft", draft_solver.__call__, draft_solver.acall))
     builder.add_edge(START, "draft")
-    builder.add_node("retrieve", retrieve_examples)
-    builder.add_node("solve", solver)
-    builder.add_node("evaluate", evaluate)
+    builder.add_node("retrieve", traced_node("retrieve", retrieve_examples, aretrieve_examples))
+    builder.add_node("solve", traced_node("solve", solver.__call__, solver.acall))
+    builder.add_node("evaluate", traced_node("evaluate", evaluate, aevaluate))
     builder.add_edge("draft", "retrieve")
     builder.add_edge("retrieve", "solve")
     builder.add_edge("solve", "evaluate")
@@ -22,7 +44,8 @@ def build_graph(draft_solver, solver):
         return "solve"
 
     builder.add_conditional_edges("evaluate", control_edge, {END: END, "solve": "solve"})
-    checkpointer = MemorySaver()
+    if checkpointer is None:
+        checkpointer = SqliteDeltaSaver(checkpoint_path) if checkpoint_path else MemorySaver()
 
     graph = builder.compile(
         checkpointer=checkpointer,
@@ -30,4 +53,8 @@ def build_graph(draft_solver, solver):
         interrupt_after=["evaluate"],
     )
     
-    return graph
\ No newline at end of file
+    return graph
+
+def reset_thread(graph, thread_id: str):
+    # Checkpoints can outlive the process, so a fresh solve must not resume an old thread
+    graph.checkpointer.delete_thread(thread_id)
@@ -0,0 +1,301 @@
+import json
+import os
+import zlib
+from collections import Counter
+import numpy as np
+
+def tokenize(text: str) -> list[str]:
+    # Same preprocessing as langchain's BM25Retriever
+    return text.split()
+
+class ExampleIndex:
+    """
+    Base class for retrieval backends over the example corpus.
+
+    The corpus (ids and texts) and each backend's scoring arrays are stored as flat
+    files so an index is built once and memory-mapped by every later process.
+    Subclasses implement scores_batch, which scores many queries at once.
+    """
+
+    NAME = None
+    VERSION = 1
+
+    def __init__(self, ids, text_offsets, texts):
+        self.ids = ids
+        self.text_offsets = text_offsets
+        self.texts = texts
+        self._positions = {}
+        for i, doc_id in enumerate(ids):
+            self._positions.setdefault(doc_id, []).append(i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _encode_corpus(texts: list[str]):
+        encoded = [text.encode() for text in texts]
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=text_offsets[1:])
+        return text_offsets, b"".join(encoded)
+
+    def _save_corpus(self, path: str):
+        np.save(os.path.join(path, "text_offsets.npy"), self.text_offsets)
+        with open(os.path.join(path, "texts.bin"), "wb") as file:
+            file.write(self.texts)
+
+    @staticmethod
+    def _load_corpus(path: str):
+        texts_path = os.path.join(path, "texts.bin")
+        texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+        return np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r"), texts
+
+    def _write_meta(self, path: str):
+        # Written last so a partially saved index is never picked up
+        with open(os.path.join(path, f"{self.NAME}.json"), "w") as file:
+            json.dump({"version": self.VERSION, "ids": self.ids}, file)
+
+    @classmethod
+    def _read_meta(cls, path: str) -> dict:
+        with open(os.path.join(path, f"{cls.NAME}.json")) as file:
+            return json.load(file)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        try:
+            return cls._read_meta(path).get("version") == cls.VERSION
+        except (OSError, ValueError):
+            return False
+
+    def text(self, i: int) -> str:
+        return bytes(self.texts[self.text_offsets[i]:self.text_offsets[i + 1]]).decode()
+
+    def scores_batch(self, queries: list[str]) -> np.ndarray:
+        """Returns a (len(queries), len(self)) score matrix."""
+        raise NotImplementedError
+
+    def search(self, query: str, k: int, exclude=()) -> list[tuple[int, float]]:
+        """
+        Returns the (document index, score) of the k best matches for query.
+        Documents whose id is in exclude are filtered out at query time.
+        """
+        return self.search_batch([query], k, [exclude])[0]
+
+    def search_batch(self, queries: list[str], k: int, excludes=None) -> list[list[tuple[int, float]]]:
+        """search for many queries in one pass; excludes holds one id collection per query."""
+        if not queries:
+            return []
+        scores = self.scores_batch(queries)
+        for q, exclude in enumerate(excludes or ()):
+            for doc_id in exclude or ():
+                scores[q, self._positions.get(doc_id, [])] = -np.inf
+        k = min(k, len(self))
+        if k <= 0:
+            return [[] for _ in queries]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(int(i), float(s)) for i, s in zip(row, row_scores) if np.isfinite(s)]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+class BM25Index(ExampleIndex):
+    """
+    Okapi BM25 over whitespace tokens, matching rank_bm25.BM25Okapi (which
+    langchain's BM25Retriever uses).
+
+    Postings are grouped by term (CSR layout) and already hold each document's
+    BM25 term weight, so scoring a batch of queries is one gather plus one bincount.
+    """
+
+    NAME = "bm25"
+
+    def __init__(self, ids, text_offsets, texts, vocab, postings_ptr, postings_doc, postings_weight):
+        super().__init__(ids, text_offsets, texts)
+        self.vocab = vocab
+        self.postings_ptr = postings_ptr
+        self.postings_doc = postings_doc
+        self.postings_weight = postings_weight
+
+    @classmethod
+    def build(cls, texts: list[str], ids: list[str], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(len(texts), dtype=np.float64)
+        for d, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[d] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(d)
+                tfs.append(tf)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float64)
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        postings_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=postings_ptr[1:])
+
+        n = len(texts)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        # rank_bm25 floors negative idf values at a fraction of the average idf
+        idf[idf < 0] = epsilon * idf.mean() if len(idf) else 0.0
+        avgdl = doc_len.mean() if n else 0.0
+        norm = k1 * (1 - b + b * doc_len[doc_ids] / avgdl) if n else 0.0
+        postings_weight = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+        return cls(list(ids), *cls._encode_corpus(texts), vocab, postings_ptr, doc_ids, postings_weight)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self._save_corpus(path)
+        np.save(os.path.join(path, "bm25_postings_ptr.npy"), self.postings_ptr)
+        np.save(os.path.join(path, "bm25_postings_doc.npy"), self.postings_doc)
+        np.save(os.path.join(path, "bm25_postings_weight.npy"), self.postings_weight)
+        with open(os.path.join(path, "bm25_vocab.json"), "w") as file:
+            json.dump(self.vocab, file)
+        self._write_meta(path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a saved index with every array memory-mapped rather than read."""
+        meta = cls._read_meta(path)
+        with open(os.path.join(path, "bm25_vocab.json")) as file:
+            vocab = json.load(file)
+        return cls(
+            meta["ids"],
+            *cls._load_corpus(path),
+            vocab,
+            np.load(os.path.join(path, "bm25_postings_ptr.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "bm25_postings_doc.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "bm25_postings_weight.npy"), mmap_mode="r"),
+        )
+
+    def scores_batch(self, queries: list[str]) -> np.ndarray:
+        n = len(self)
+        query_ids, term_ids = [], []
+        for q, query in enumerate(queries):
+            for token in tokenize(query):
+                term = self.vocab.get(token)
+                if term is not None:
+                    query_ids.append(q)
+                    term_ids.append(term)
+        if not term_ids:
+            return np.zeros((len(queries), n), dtype=np.float32)
+        term_ids = np.asarray(term_ids)
+        starts = self.postings_ptr[term_ids]
+        lengths = self.postings_ptr[term_ids + 1] - starts
+        # Expand every (start, length) range into posting positions without a Python loop
+        postings = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rows = np.repeat(np.asarray(query_ids), lengths)
+        scores = np.bincount(
+            rows * n + self.postings_doc[postings],
+            weights=self.postings_weight[postings],
+            minlength=len(queries) * n,
+        )
+        return scores.reshape(len(queries), n).astype(np.float32)
+
+class TfidfIndex(ExampleIndex):
+    """
+    Dense TF-IDF embeddings of the corpus using the hashing trick, so no vocabulary
+    is needed. Rows are L2-normalized and a batch of queries is scored with a single
+    matrix product (cosine similarity).
+    """
+
+    NAME = "tfidf"
+
+    def __init__(self, ids, text_offsets, texts, idf, embeddings):
+        super().__init__(ids, text_offsets, texts)
+        self.idf = idf
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _counts(texts: list[str], dim: int) -> np.ndarray:
+        counts = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, tf in Counter(tokenize(text)).items():
+                counts[row, zlib.crc32(token.encode()) % dim] += tf
+        return counts
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @classmethod
+    def build(cls, texts: list[str], ids: list[str], dim: int = 4096):
+        counts = cls._counts(texts, dim)
+        df = (counts > 0).sum(axis=0)
+        idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        tf = np.log1p(counts, out=counts)
+        embeddings = cls._normalize(tf * idf).astype(np.float32)
+        return cls(list(ids), *cls._encode_corpus(texts), idf, embeddings)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self._save_corpus(path)
+        np.save(os.path.join(path, "tfidf_idf.npy"), self.idf)
+        np.save(os.path.join(path, "tfidf_embeddings.npy"), self.embeddings)
+        self._write_meta(path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a saved index with every array memory-mapped rather than read."""
+        meta = cls._read_meta(path)
+        return cls(
+            meta["ids"],
+            *cls._load_corpus(path),
+            np.load(os.path.join(path, "tfidf_idf.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "tfidf_embeddings.npy"), mmap_mode="r"),
+        )
+
+    def embed(self, queries: list[str]) -> np.ndarray:
+        tf = np.log1p(self._counts(queries, len(self.idf)))
+        return self._normalize(tf * self.idf).astype(np.float32)
+
+    def scores_batch(self, queries: list[str]) -> np.ndarray:
+        return self.embed(queries) @ self.embeddings.T
+
+class HybridIndex(ExampleIndex):
+    """
+    Weighted sum of BM25 scores (scaled to [0, 1] per query) and TF-IDF cosine
+    similarity. alpha is the weight of the BM25 part.
+    """
+
+    NAME = "hybrid"
+
+    def __init__(self, bm25: BM25Index, tfidf: TfidfIndex, alpha: float = 0.5):
+        super().__init__(bm25.ids, bm25.text_offsets, bm25.texts)
+        self.bm25 = bm25
+        self.tfidf = tfidf
+        self.alpha = alpha
+
+    @classmethod
+    def build(cls, texts: list[str], ids: list[str], alpha: float = 0.5):
+        return cls(BM25Index.build(texts, ids), TfidfIndex.build(texts, ids), alpha)
+
+    def save(self, path: str):
+        self.bm25.save(path)
+        self.tfidf.save(path)
+        self._write_meta(path)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return BM25Index.exists(path) and TfidfIndex.exists(path)
+
+    @classmethod
+    def load(cls, path: str, alpha: float = 0.5):
+        return cls(BM25Index.load(path), TfidfIndex.load(path), alpha)
+
+    def scores_batch(self, queries: list[str]) -> np.ndarray:
+        lexical = self.bm25.scores_batch(queries)
+        peak = lexical.max(axis=1, keepdims=True) if len(self) else lexical
+        lexical /= np.where(peak > 0, peak, 1.0)
+        return self.alpha * lexical + (1 - self.alpha) * self.tfidf.scores_batch(queries)
+
+BACKENDS = {index.NAME: index for index in (BM25Index, TfidfIndex, HybridIndex)}
@@ -0,0 +1,120 @@
+'''
+Local instrumentation for the solve loop.
+
+Spans time graph nodes, LLM calls, retrieval and every test run in the sandbox. They
+are kept in memory and written out as a Chrome trace (open it in chrome://tracing or
+https://ui.perfetto.dev) together with a summary table, so no data leaves the machine.
+Tracing is off unless trace_path is set or main.py is run with --trace.
+'''
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from config import trace_path
+
+def _track() -> int:
+    # Concurrent problems on one event loop share a thread, so give each task its own track
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+class Span:
+    __slots__ = ("args",)
+
+    def __init__(self):
+        self.args = {}
+
+    def set(self, **args):
+        '''Attaches values known only once the span's work is done, e.g. token counts.'''
+        self.args.update(args)
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        if not self.enabled:
+            yield Span()
+            return
+        span = Span()
+        span.args.update(args)
+        start = time.perf_counter_ns()
+        try:
+            yield span
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": _track(),
+                "args": span.args,
+            }
+            with self._lock:
+                self._events.append(event)
+
+    def events(self) -> list[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def save(self, path: str):
+        '''Writes the Chrome trace to path and the summary table next to it.'''
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, file)
+        with open(os.path.splitext(path)[0] + ".txt", "w") as file:
+            file.write(self.summary() + "\n")
+
+    def summary(self) -> str:
+        '''Latency per span name plus the share of node time spent in each category.'''
+        events = self.events()
+        if not events:
+            return "No spans recorded."
+        by_name = defaultdict(list)
+        by_category = defaultdict(float)
+        tokens = 0
+        for event in events:
+            by_name[(event["cat"], event["name"])].append(event["dur"] / 1000)
+            by_category[event["cat"]] += event["dur"] / 1e6
+            tokens += event["args"].get("tokens") or 0
+        lines = [f"{'span':<24}{'count':>7}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for (category, name), durations in sorted(by_name.items()):
+            durations.sort()
+            lines.append(
+                f"{category + ':' + name:<24}{len(durations):>7}{sum(durations) / 1000:>10.2f}"
+                f"{sum(durations) / len(durations):>10.1f}{_percentile(durations, 0.5):>10.1f}"
+                f"{_percentile(durations, 0.95):>10.1f}{durations[-1]:>10.1f}"
+            )
+        # Node spans cover the whole iteration; the other categories are nested inside them
+        node_time = by_category.get("node") or sum(by_category.values())
+        shares = ", ".join(
+            f"{category} {seconds:.2f}s ({seconds / node_time:.0%})"
+            for category, seconds in sorted(by_category.items())
+            if category != "node"
+        )
+        lines.append(f"Node time {node_time:.2f}s: {shares or 'no nested spans'}")
+        lines.append(f"Tokens: {tokens}")
+        return "\n".join(lines)
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+tracer = Tracer(enabled=trace_path is not None)
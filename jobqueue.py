@@ -0,0 +1,374 @@
+'''
+Job queue for running tests on other machines.
+
+A broker accepts (program, test) jobs from solvers and hands them out to worker
+processes, which may run on any host that can reach it. Messages are length-prefixed
+JSON over TCP. Programs travel with each job (workers reuse compiled code by hash) and
+test files are content-addressed: the submitter uploads a test to the broker once and
+each worker downloads it once into its own store.
+
+A leased job goes back on the queue if its worker disconnects or does not answer
+within the test's timeout plus queue_lease_grace; after queue_max_attempts it fails
+with a sandbox error, which execution.py never caches.
+
+Workers run whatever programs are submitted, so every connection must first present
+queue_token (QUEUE_TOKEN in the environment) and the broker should only listen on a
+private interface. Uploaded tests are capped at queue_max_upload bytes and must
+match their digest.
+
+    QUEUE_TOKEN=... python jobqueue.py broker --address 10.0.0.1:8765
+    QUEUE_TOKEN=... python jobqueue.py worker --address 10.0.0.1:8765 --slots 4
+'''
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from atomicfile import atomic_write
+from config import (
+    broker_address, queue_lease_grace, queue_max_attempts, queue_store_path, queue_wait_timeout,
+    queue_token, queue_max_upload,
+)
+
+_HEADER = struct.Struct("!I")
+_LEASE_POLL = 5.0  # seconds an idle worker waits for a job before asking again
+_AUTH_LIMIT = 4096  # largest message accepted before a connection has authenticated
+# Uploads are base64 encoded inside JSON, which adds a third plus some framing
+_MESSAGE_LIMIT = queue_max_upload * 4 // 3 + (1 << 20)
+
+def send_message(sock: socket.socket, message: dict):
+    data = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise EOFError("connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock: socket.socket, max_size: int = None) -> dict:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if max_size is not None and size > max_size:
+        raise ValueError(f"message of {size} bytes is over the {max_size} byte limit")
+    return json.loads(_recv_exact(sock, size))
+
+def connect(address: str, token: str = queue_token) -> socket.socket:
+    '''Opens a connection to the broker and authenticates it.'''
+    sock = socket.create_connection(parse_address(address))
+    try:
+        send_message(sock, {"op": "auth", "token": token})
+        reply = recv_message(sock)
+    except BaseException:
+        sock.close()
+        raise
+    if "error" in reply:
+        sock.close()
+        raise ConnectionError(f"broker refused connection: {reply['error']}")
+    return sock
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def _test_paths(store_path: str, digest: str) -> tuple[str, str]:
+    # Digests come off the network and become file names
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        raise ValueError(f"invalid test digest {digest!r}")
+    return os.path.join(store_path, digest + ".in"), os.path.join(store_path, digest + ".out")
+
+def _read_b64(path: str) -> str:
+    with open(path, "rb") as file:
+        return base64.b64encode(file.read()).decode()
+
+class Broker(socketserver.ThreadingTCPServer):
+    '''Queue of pending jobs and the leases held by connected workers.'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address: tuple[str, int], store_path: str = os.path.join(queue_store_path, "broker"),
+        token: str = queue_token,
+    ):
+        if not token:
+            raise ValueError("queue_token (QUEUE_TOKEN) must be set: workers run whatever the broker hands out")
+        super().__init__(address, _BrokerHandler)
+        self.token = token
+        self.store_path = store_path
+        os.makedirs(store_path, exist_ok=True)
+        self.pending = collections.deque()
+        self.jobs = {}  # job id -> {"spec", "attempts", "done", "result", "lease"}
+        self.cond = threading.Condition()
+        threading.Thread(target=self._expire_leases, daemon=True).start()
+
+    def submit(self, spec: dict) -> dict:
+        '''Queues a job and blocks until a worker returns its result.'''
+        job_id = uuid.uuid4().hex
+        job = {"spec": spec, "attempts": 0, "done": threading.Event(), "result": None, "lease": None}
+        with self.cond:
+            self.jobs[job_id] = job
+            self.pending.append(job_id)
+            self.cond.notify()
+        finished = job["done"].wait(queue_wait_timeout)
+        with self.cond:
+            del self.jobs[job_id]
+            if not finished:
+                if job_id in self.pending:
+                    self.pending.remove(job_id)
+                return {"verdict": f"failed: sandbox error: no worker finished the job in {queue_wait_timeout}s"}
+        return job["result"]
+
+    def lease(self, worker: str, wait: float) -> tuple[str, dict]:
+        with self.cond:
+            if not self.pending:
+                self.cond.wait(wait)
+            if not self.pending:
+                return None, None
+            job_id = self.pending.popleft()
+            job = self.jobs[job_id]
+            job["attempts"] += 1
+            deadline = time.monotonic() + job["spec"]["timeout"] + queue_lease_grace
+            job["lease"] = (worker, deadline)
+            return job_id, job["spec"]
+
+    def complete(self, worker: str, job_id: str, result: dict):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            # Ignore answers for leases that already expired and were handed to someone else
+            if job is None or job["lease"] is None or job["lease"][0] != worker:
+                return
+            job["lease"] = None
+            job["result"] = result
+            job["done"].set()
+
+    def release(self, worker: str):
+        '''Requeues every job leased by a worker whose connection dropped.'''
+        with self.cond:
+            for job_id, job in self.jobs.items():
+                if job["lease"] is not None and job["lease"][0] == worker:
+                    self._retry(job_id, job, "worker disconnected")
+
+    def _retry(self, job_id: str, job: dict, reason: str):
+        # Called with self.cond held
+        job["lease"] = None
+        if job["attempts"] >= queue_max_attempts:
+            # Same prefix as execution.SANDBOX_FAILURE, so the verdict is never cached
+            job["result"] = {"verdict": f"failed: sandbox error: {reason} after {job['attempts']} attempts"}
+            job["done"].set()
+        else:
+            self.pending.appendleft(job_id)
+            self.cond.notify()
+
+    def _expire_leases(self):
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            with self.cond:
+                for job_id, job in list(self.jobs.items()):
+                    if job["lease"] is not None and job["lease"][1] < now:
+                        self._retry(job_id, job, "lease expired")
+
+    def authenticate(self, message: dict) -> bool:
+        token = message.get("token") if message.get("op") == "auth" else None
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def store_test(self, message: dict):
+        inputs = base64.b64decode(message["input"])
+        outputs = base64.b64decode(message["output"])
+        if len(inputs) + len(outputs) > queue_max_upload:
+            raise ValueError(f"test is over the {queue_max_upload} byte upload limit")
+        # Same digest as testcases.py, so a test cannot be stored under another test's name
+        if hashlib.sha256(inputs + b"\0" + outputs).hexdigest() != message["digest"]:
+            raise ValueError("test contents do not match their digest")
+        input_path, output_path = _test_paths(self.store_path, message["digest"])
+        for path, content in ((input_path, inputs), (output_path, outputs)):
+            with atomic_write(path) as file:
+                file.write(content)
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        broker: Broker = self.server
+        worker = uuid.uuid4().hex  # leases are tied to this connection
+        try:
+            if not broker.authenticate(recv_message(self.request, _AUTH_LIMIT)):
+                send_message(self.request, {"error": "invalid token"})
+                return
+            send_message(self.request, {"ok": True})
+            while True:
+                message = recv_message(self.request, _MESSAGE_LIMIT)
+                op = message["op"]
+                if op == "submit":
+                    send_message(self.request, {"result": broker.submit(message["job"])})
+                elif op == "lease":
+                    job_id, spec = broker.lease(worker, message.get("wait", _LEASE_POLL))
+                    send_message(self.request, {"job_id": job_id, "job": spec})
+                elif op == "complete":
+                    broker.complete(worker, message["job_id"], message["result"])
+                elif op == "has_test":
+                    input_path, output_path = _test_paths(broker.store_path, message["digest"])
+                    send_message(self.request, {"found": os.path.exists(output_path)})
+                elif op == "put_test":
+                    try:
+                        broker.store_test(message)
+                    except ValueError as e:
+                        send_message(self.request, {"error": str(e)})
+                    else:
+                        send_message(self.request, {"ok": True})
+                elif op == "get_test":
+                    input_path, output_path = _test_paths(broker.store_path, message["digest"])
+                    send_message(self.request, {"input": _read_b64(input_path), "output": _read_b64(output_path)})
+                else:
+                    send_message(self.request, {"error": f"unknown op {op!r}"})
+        except (EOFError, OSError, ValueError, KeyError):
+            # Disconnects, and oversized or malformed messages, which end the connection
+            pass
+        finally:
+            broker.release(worker)
+
+class QueueClient:
+    '''Submits tests to a broker. Each calling thread gets its own connection.'''
+
+    def __init__(self, address: str = broker_address, token: str = queue_token):
+        self.address = address
+        self.token = token
+        self._local = threading.local()
+        self._uploaded = set()
+        self._uploaded_lock = threading.Lock()
+
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = connect(self.address, self.token)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, message: dict) -> dict:
+        try:
+            sock = self._socket()
+            send_message(sock, message)
+            return recv_message(sock)
+        except (EOFError, OSError):
+            # Reconnect on the next call
+            self._local.sock = None
+            raise
+
+    def _upload(self, test_case: dict):
+        digest = test_case["digest"]
+        with self._uploaded_lock:
+            if digest in self._uploaded:
+                return
+        if not self._request({"op": "has_test", "digest": digest})["found"]:
+            reply = self._request({
+                "op": "put_test",
+                "digest": digest,
+                "input": _read_b64(test_case["input_path"]),
+                "output": _read_b64(test_case["output_path"]),
+            })
+            if "error" in reply:
+                raise ConnectionError(f"broker rejected test upload: {reply['error']}")
+        with self._uploaded_lock:
+            self._uploaded.add(digest)
+
+    def run(self, source: str, digest: str, test_case: dict, timeout: float, memory_limit: int = None) -> dict:
+        '''Runs one test on some worker and returns its result fields (see execution.TestResult).'''
+        self._upload(test_case)
+        job = {
+            "source": source,
+            "digest": digest,
+            "test": test_case["digest"],
+            "timeout": timeout,
+            "memory_limit": memory_limit,
+        }
+        return self._request({"op": "submit", "job": job})["result"]
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> QueueClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = QueueClient()
+        return _client
+
+def _fetch_test(sock: socket.socket, digest: str, store_path: str) -> dict:
+    input_path, output_path = _test_paths(store_path, digest)
+    if not os.path.exists(output_path):
+        send_message(sock, {"op": "get_test", "digest": digest})
+        data = recv_message(sock)
+        for path, key in ((input_path, "input"), (output_path, "output")):
+            with atomic_write(path) as file:
+                file.write(base64.b64decode(data[key]))
+    return {"input_path": input_path, "expected_path": output_path}
+
+def worker_loop(address: str, store_path: str, token: str = queue_token):
+    '''Leases jobs from the broker forever, running each in the local sandbox pool.'''
+    # Imported here so the broker does not need the execution stack
+    from execution import compile_program, format_compile_error, run_test
+    os.makedirs(store_path, exist_ok=True)
+    sock = connect(address, token)
+    while True:
+        send_message(sock, {"op": "lease", "wait": _LEASE_POLL})
+        reply = recv_message(sock)
+        if reply["job"] is None:
+            continue
+        job = reply["job"]
+        try:
+            program = compile_program(job["source"])
+        except (SyntaxError, ValueError) as e:
+            result = format_compile_error(e)
+        else:
+            test = _fetch_test(sock, job["test"], store_path)
+            result = run_test(program, test, job["timeout"], job["memory_limit"], mode="pool")
+        send_message(sock, {"op": "complete", "job_id": reply["job_id"], "result": result._asdict()})
+
+def run_worker(address: str, slots: int, store_path: str):
+    threads = []
+    for _ in range(slots):
+        thread = threading.Thread(target=_worker_forever, args=(address, store_path), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+def _worker_forever(address: str, store_path: str):
+    # A lost broker connection is retried; the broker requeues whatever was leased
+    for delay in itertools.chain([0], itertools.repeat(2)):
+        time.sleep(delay)
+        try:
+            worker_loop(address, store_path)
+        except (EOFError, OSError) as e:
+            print(f"worker: connection to {address} lost ({e}), reconnecting")
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed test execution.")
+    parser.add_argument("role", choices=["broker", "worker"])
+    parser.add_argument("--address", default=broker_address, help="host:port of the broker")
+    parser.add_argument("--slots", type=int, default=os.cpu_count() or 1, help="tests a worker runs at once")
+    parser.add_argument("--store", default=None, help="directory for test files")
+    args = parser.parse_args()
+    if not queue_token:
+        parser.error("set QUEUE_TOKEN (or queue_token in config.py) to the secret shared by the broker and workers")
+    if args.role == "broker":
+        broker = Broker(parse_address(args.address), args.store or os.path.join(queue_store_path, "broker"))
+        print(f"broker listening on {args.address}")
+        broker.serve_forever()
+    else:
+        run_worker(args.address, args.slots, args.store or os.path.join(queue_store_path, "worker"))
+
+if __name__ == "__main__":
+    main()
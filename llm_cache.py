@@ -0,0 +1,167 @@
+'''
+Content-addressed cache of LLM responses, and a stub model for offline runs.
+
+Responses are keyed by the model's identity (class, parameters, bound tools) and the
+rendered prompt messages. Message and tool call ids are left out of the key because
+they are random per run, so a recorded run can be replayed exactly: each replayed
+response leads to the same next prompt, which is again in the cache. In "replay" mode
+a miss raises instead of calling the model, so benchmarks run offline and never
+silently spend tokens.
+'''
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+from cache import LRUCache
+from config import llm_cache_mode, llm_cache_path, llm_cache_size, llm_cache_ttl
+
+class CacheMissError(RuntimeError):
+    '''Raised in replay mode when a prompt was never recorded.'''
+
+def _stable(value) -> Any:
+    # Objects without a JSON form only contribute their type, never an address
+    return type(value).__name__
+
+def model_identity(model: Runnable) -> dict:
+    '''Everything about a (possibly tool-bound) chat model that can change its answer.'''
+    llm = getattr(model, "bound", model)
+    return {
+        "class": type(llm).__name__,
+        "params": getattr(llm, "_identifying_params", {}),
+        "kwargs": getattr(model, "kwargs", {}),
+    }
+
+def _message_key(message: BaseMessage) -> dict:
+    key = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        key["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+    return key
+
+def prompt_key(identity: dict, prompt: PromptValue) -> str:
+    messages = [_message_key(message) for message in prompt.to_messages()]
+    payload = json.dumps([identity, messages], sort_keys=True, default=_stable)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class CachedChatModel(Runnable):
+    '''
+    Wraps a chat model so identical prompts are answered from cache. mode is "record"
+    (read through, store new responses) or "replay" (cache only).
+    '''
+
+    def __init__(self, model: Runnable, cache: LRUCache, mode: str = "record"):
+        self.model = model
+        self.cache = cache
+        self.mode = mode
+        self._identity = model_identity(model)
+
+    def _lookup(self, key: str) -> Optional[AIMessage]:
+        response = self.cache.get(key)
+        if response is None and self.mode == "replay":
+            raise CacheMissError(f"No recorded response for prompt {key[:12]} in replay mode")
+        return response
+
+    def _batch_keys(self, inputs: list[PromptValue]) -> list[str]:
+        # Identical prompts in one batch are independent samples, so each gets its own entry
+        seen = Counter()
+        keys = []
+        for prompt in inputs:
+            key = prompt_key(self._identity, prompt)
+            keys.append(f"{key}:{seen[key]}" if seen[key] else key)
+            seen[key] += 1
+        return keys
+
+    def invoke(self, input: PromptValue, config: Optional[RunnableConfig] = None, **kwargs) -> AIMessage:
+        key = prompt_key(self._identity, input)
+        response = self._lookup(key)
+        if response is None:
+            response = self.model.invoke(input, config, **kwargs)
+            self.cache.set(key, response)
+        return response
+
+    async def ainvoke(self, input: PromptValue, config: Optional[RunnableConfig] = None, **kwargs) -> AIMessage:
+        key = prompt_key(self._identity, input)
+        response = self._lookup(key)
+        if response is None:
+            response = await self.model.ainvoke(input, config, **kwargs)
+            self.cache.set(key, response)
+        return response
+
+    def _split(self, inputs: list[PromptValue], config) -> tuple[list, list[str], list[int], list]:
+        keys = self._batch_keys(inputs)
+        responses = [self._lookup(key) for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        return responses, keys, missing, [configs[i] for i in missing]
+
+    def batch(self, inputs: list[PromptValue], config=None, **kwargs) -> list[AIMessage]:
+        responses, keys, missing, configs = self._split(inputs, config)
+        if missing:
+            fresh = self.model.batch([inputs[i] for i in missing], configs, **kwargs)
+            for i, response in zip(missing, fresh):
+                responses[i] = response
+                self.cache.set(keys[i], response)
+        return responses
+
+    async def abatch(self, inputs: list[PromptValue], config=None, **kwargs) -> list[AIMessage]:
+        responses, keys, missing, configs = self._split(inputs, config)
+        if missing:
+            fresh = await self.model.abatch([inputs[i] for i in missing], configs, **kwargs)
+            for i, response in zip(missing, fresh):
+                responses[i] = response
+                self.cache.set(keys[i], response)
+        return responses
+
+_cache = None
+
+def get_llm_cache() -> LRUCache:
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(llm_cache_size, llm_cache_path, ttl=llm_cache_ttl)
+    return _cache
+
+def cached(model: Runnable, mode: str = None) -> Runnable:
+    '''Returns model wrapped in the shared response cache, or unchanged when caching is off.'''
+    mode = mode or llm_cache_mode
+    if mode == "off":
+        return model
+    return CachedChatModel(model, get_llm_cache(), mode)
+
+class StubChatModel(BaseChatModel):
+    '''
+    Offline stand-in for the live model. Answers every prompt with a writePython call
+    for the next program in programs (repeating the last one), so the whole graph can
+    run without network access or an API key.
+    '''
+
+    programs: list[str] = ["print()"]
+    calls: int = 0
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        code = self.programs[min(self.calls, len(self.programs) - 1)]
+        self.calls += 1
+        message = AIMessage(
+            content="",
+            tool_calls=[{
+                "name": "writePython",
+                "args": {"reasoning": "stub", "pseudocode": "stub", "code": code},
+                "id": f"stub-{self.calls}",
+            }],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        # Always answers with writePython, so there is nothing to bind
+        return self
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"programs": self.programs}
@@ -1,23 +1,62 @@
-from langchain import hub
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
+from langchain_core.load import dumps, loads
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from solver import Solver
-from graph import build_graph
+from graph import build_graph, reset_thread
 import os
+import argparse
+import asyncio
+import warnings
+from contextlib import nullcontext
 from langsmith import Client
 from utils import _hide_test_cases, get_problem_ds, get_problem
 import re
 from langchain_core.tracers.context import tracing_v2_enabled
 from utils import filter_python_code
-from retrieval import ds
+from retrieval import get_dataset
+from batch import run_batch, arun_batch
+from config import llm_requests_per_second, trace_path, llm_provider, prompt_cache_path, llm_cache_mode
+from instrument import tracer
+from llm_cache import StubChatModel
+from atomicfile import atomic_write
 
-def initialize_solvers():
-    prompt = hub.pull("wfh/usaco-draft-solver")
-    llm_claude = ChatAnthropic(model="claude-3-opus-20240229", max_tokens=4096, temperature=0.2)
-    llm_openai = ChatOpenAI(model="gpt-4o", temperature=0.0) 
+def load_prompt(name="wfh/usaco-draft-solver"):
+    '''Pulls the prompt from the LangChain hub once, then reads it from a local copy.'''
+    if os.path.exists(prompt_cache_path):
+        with open(prompt_cache_path) as file, warnings.catch_warnings():
+            # loads() warns that its API is in beta; the file is our own output
+            warnings.simplefilter("ignore")
+            return loads(file.read())
+    from langchain import hub
+    prompt = hub.pull(name)
+    directory = os.path.dirname(prompt_cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with atomic_write(prompt_cache_path, "w") as file:
+        file.write(dumps(prompt))
+    return prompt
 
-    draft_solver = Solver(llm_claude, prompt.partial(examples=""))
-    solver = Solver(llm_claude, prompt)
+def langsmith_tracing(client):
+    # Offline runs (replay, stub) get client None and send nothing to LangSmith
+    return tracing_v2_enabled(client=client) if client is not None else nullcontext()
+
+def make_llm(provider, rate_limiter):
+    # Provider SDKs take seconds to import, so only the one in use is loaded
+    if provider == "stub":
+        return StubChatModel()
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model="gpt-4o", temperature=0.0, rate_limiter=rate_limiter)
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model="claude-3-opus-20240229", max_tokens=4096, temperature=0.2, rate_limiter=rate_limiter)
+
+def initialize_solvers(cache_mode=None, provider=llm_provider):
+    prompt = load_prompt()
+    # Shared by every solver so concurrent problems are throttled together
+    rate_limiter = InMemoryRateLimiter(requests_per_second=llm_requests_per_second)
+    llm = make_llm(provider, rate_limiter)
+
+    draft_solver = Solver(llm, prompt.partial(examples=""), cache_mode)
+    solver = Solver(llm, prompt, cache_mode)
     
     return draft_solver, solver
 
@@ -28,7 +67,7 @@ def solve(problem, graph, client):
 
     #Runs the solver num_trials times    
     def run_solver(stream_state, num_trials, new_config):
-        with tracing_v2_enabled(client=client):
+        with langsmith_tracing(client):
             for _ in range(num_trials):
                 events = graph.stream(stream_state, new_config)
                 for event in events:
@@ -55,8 +94,7 @@ def solve(problem, graph, client):
 
     # Displays diagnostic for most recent attempt
     def display_diagnostic():
-        most_recent_state = list(graph.get_state_history(config))[0]
-        snapshot = graph.get_state(most_recent_state.config)
+        snapshot = graph.get_state(config)
         
         # Find the most recent AI message
         ai_message = None
@@ -136,6 +174,7 @@ def solve(problem, graph, client):
             },
         )
         
+    reset_thread(graph, problem["title"])
     run_solver(problem, 1, config) #first iteration of solver
     while True and graph.get_state(config).values["status"] != "success": #keeps solving and asking for feedback until either the program is successful or the user terminates
         display_diagnostic()
@@ -165,8 +204,7 @@ def solve_no_interrupt(trials, problem, graph, client):
             print(f"Test Case {i}:\n {match[:50]}...") 
 
     def display_diagnostic():
-        most_recent_state = list(graph.get_state_history(config))[0]
-        snapshot = graph.get_state(most_recent_state.config)
+        snapshot = graph.get_state(config)
         ai_message = snapshot.values["messages"][-2]
         print("*" * 35 + " Previous Attempt Diagnostic " + "*" * 35)
         print("\n\nThought Process:\n\n")
@@ -182,7 +220,7 @@ def solve_no_interrupt(trials, problem, graph, client):
 
     #Runs the solver num_trials times
     def run_solver(stream_state, num_trials, new_config):
-        with tracing_v2_enabled(client=client):
+        with langsmith_tracing(client):
             for _ in range(num_trials):
                 events = graph.stream(stream_state, new_config)
                 for event in events:
@@ -201,14 +239,14 @@ def solve_no_interrupt(trials, problem, graph, client):
                             print("Retrieved examples:\n\n", value["examples"][:300] + "...")
                         elif value.get("candidate"):
                             print(str(value["candidate"].content)[:200])
-                most_recent_state = list(graph.get_state_history(config))[0]
-                snapshot = graph.get_state(most_recent_state.config)
+                snapshot = graph.get_state(config)
                 print(snapshot.values["messages"][-1].content[:133])
                 if graph.get_state(config).values["status"] == "success":
                     print("\n\n\n\n\n\nCode successful.\n\n\n\n\n\n")
                     display_diagnostic()
                     return ""
 
+    reset_thread(graph, problem["title"])
     run_solver(problem, 1, config) #first iteration
     if graph.get_state(config).values["status"] != "success":
         run_solver(None, trials-1, config) #other trials-1 iterations
@@ -216,14 +254,55 @@ def solve_no_interrupt(trials, problem, graph, client):
 
     return graph.get_state(config).values["status"]
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Solve USACO problems with an LLM solver.")
+    parser.add_argument("--batch", action="store_true", help="solve a dataset slice without human feedback")
+    parser.add_argument("--start", type=int, default=0, help="first dataset row of the batch")
+    parser.add_argument("--end", type=int, default=None, help="dataset row to stop before")
+    parser.add_argument("--trials", type=int, default=5, help="solve attempts per problem")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="problems solved at the same time")
+    parser.add_argument("--use-async", action="store_true", help="multiplex the batch on one event loop")
+    parser.add_argument("--trace", default=trace_path, help="write a Chrome trace and summary of where time goes")
+    parser.add_argument("--llm-cache", choices=["off", "record", "replay"], default=None,
+                        help="cache model responses; replay fails on any prompt that was not recorded")
+    parser.add_argument("--stub", action="store_true", help="use an offline stub instead of the live model")
+    return parser.parse_args()
+
 def main():
-    draft_solver, solver = initialize_solvers()
+    args = parse_args()
+    if args.trace:
+        tracer.enabled = True
+    try:
+        run(args)
+    finally:
+        if args.trace:
+            tracer.save(args.trace)
+            print(tracer.summary())
+
+def run(args):
+    draft_solver, solver = initialize_solvers(args.llm_cache, "stub" if args.stub else llm_provider)
     graph = build_graph(draft_solver, solver)
     
-    os.environ["LANGCHAIN_TRACING_V2"] = "true"
-    os.environ["LANGCHAIN_PROJECT"] = "programming_solver"
-    
-    client = Client(hide_inputs=_hide_test_cases, hide_outputs=_hide_test_cases)
+    if args.stub or (args.llm_cache or llm_cache_mode) == "replay":
+        # Replayed and stubbed runs must not touch the network
+        os.environ["LANGCHAIN_TRACING_V2"] = "false"
+        client = None
+    else:
+        os.environ["LANGCHAIN_TRACING_V2"] = "true"
+        os.environ["LANGCHAIN_PROJECT"] = "programming_solver"
+        client = Client(hide_inputs=_hide_test_cases, hide_outputs=_hide_test_cases)
+
+    ds = get_dataset()
+    if args.batch:
+        end = len(ds) if args.end is None else min(args.end, len(ds))
+        rows = ds.select(range(args.start, end))
+        with langsmith_tracing(client):
+            if args.use_async:
+                asyncio.run(arun_batch(graph, rows, args.trials, args.output, args.concurrency))
+            else:
+                run_batch(graph, rows, args.trials, args.output, args.concurrency)
+        return
 
     #Sample code to test a problem with a solver from the dataset
     row = ds[0]
@@ -3,18 +3,36 @@ from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langchain_core.messages import AIMessage
 from pydantic import BaseModel, Field
+from config import test_history_size
+
+def merge_history(left: dict, right: dict) -> dict:
+    # Versions in right move to the end, so the last entry is always the latest evaluation.
+    # The dict is checkpointed whole on every step, so only the newest versions are kept
+    merged = {key: value for key, value in (left or {}).items() if key not in (right or {})}
+    merged.update(right or {})
+    return dict(list(merged.items())[-max(1, test_history_size):])
 
 class TestCase(TypedDict):
-    inputs: str
-    outputs: str
+    # References to the test files; their contents never live in the graph state
+    input_path: str
+    output_path: str
+    input_size: int
+    digest: str  # sha256 of input, a NUL byte and output
 
 class State(TypedDict):
     # Candidate for retrieval + formatted fetched examples as "memory"
     candidate: AIMessage
     examples: str
     messages: Annotated[list[AnyMessage], add_messages]
+    samples: list[AIMessage]  # candidates from the solve node awaiting best-of-N selection
     test_cases: list[TestCase]
-    runtime_limit: int
+    # Normalized program digest -> {test digest: passed} for the latest versions evaluated in this thread
+    test_history: Annotated[dict[str, dict[str, bool]], merge_history]
+    runtime_limit: int  # seconds
+    memory_limit: int  # MB; None for no limit
+    generator: str  # optional program reading "n seed" and printing a test input of size n
+    reference: str  # optional trusted solution giving expected outputs for generated inputs
+    max_n: int  # optional largest input size allowed by the constraints
     status: str
 
 class writePython(BaseModel):
@@ -1,31 +1,107 @@
-from langchain_community.retrievers import BM25Retriever
+import asyncio
+import threading
 from langchain_core.runnables import RunnableConfig
 from models import State
 from utils import format_example, get_dataset_standard
-import datasets
+from index import BACKENDS, ExampleIndex, HybridIndex
+from config import index_path, retrieval_backend, retrieval_alpha
+from instrument import tracer
 
-# Load dataset
-ds = get_dataset_standard()
+_ds = None
+_ds_lock = threading.Lock()
+
+def get_dataset():
+    '''Loads the dataset on first use, downloading it only if there is no local copy.'''
+    global _ds
+    with _ds_lock:
+        if _ds is None:
+            _ds = get_dataset_standard()
+        return _ds
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index() -> ExampleIndex:
+    '''Returns the example index for the configured backend, building and saving it on first use.'''
+    global _index
+    with _index_lock:
+        if _index is None:
+            backend = BACKENDS[retrieval_backend]
+            kwargs = {"alpha": retrieval_alpha} if backend is HybridIndex else {}
+            with tracer.span("load_index", "retrieval", backend=retrieval_backend):
+                if not backend.exists(index_path):
+                    ds = get_dataset()
+                    backend.build(
+                        [format_example(row) for row in ds], [row["cp_id"] for row in ds], **kwargs
+                    ).save(index_path)
+                _index = backend.load(index_path, **kwargs)
+        return _index
+
+def format_examples(texts: list[str]) -> str:
+    examples_str = "\n".join(texts)
+    return f"""
+You previously solved the following problems in this competition:
+<Examples>
+{examples_str}
+<Examples>
+Approach this new question with similar sophistication."""
+
+def retrieve_examples_batch(codes: list[str], exclude_ids: list[str], top_k: int = 2) -> list[str]:
+    '''Retrieves formatted examples for many draft solutions in a single pass over the index.'''
+    return _search_batch(codes, exclude_ids, [top_k] * len(codes))
+
+def _search_batch(codes: list[str], exclude_ids: list[str], top_ks: list[int]) -> list[str]:
+    index = get_index()
+    with tracer.span("search", "retrieval", queries=len(codes)):
+        hits = index.search_batch(codes, max(top_ks, default=0), [{id} for id in exclude_ids])
+    return [format_examples([index.text(i) for i, _ in row[:k]]) for row, k in zip(hits, top_ks)]
+
+# Queries are draft solutions, so they only exist once each problem has drafted. Calls
+# that arrive while a search is running queue up and share the next pass over the index.
+_pending = []
+_pending_cond = threading.Condition()
+_searching = False
+
+def _search(code: str, exclude_id: str, top_k: int) -> str:
+    global _searching
+    request = {"code": code, "id": exclude_id, "k": top_k, "done": False, "result": None, "error": None}
+    with _pending_cond:
+        _pending.append(request)
+        while _searching and not request["done"]:
+            _pending_cond.wait()
+        if not request["done"]:
+            # No search is running, so this call searches for everything queued so far
+            _searching = True
+            batch = _pending[:]
+            _pending.clear()
+    if not request["done"]:
+        results, error = [None] * len(batch), None
+        try:
+            results = _search_batch([r["code"] for r in batch], [r["id"] for r in batch], [r["k"] for r in batch])
+        except BaseException as e:
+            error = e
+        with _pending_cond:
+            for r, result in zip(batch, results):
+                r.update(done=True, result=result, error=error)
+            _searching = False
+            _pending_cond.notify_all()
+    if request["error"] is not None:
+        raise request["error"]
+    return request["result"]
 
 def retrieve_examples(state: State, config: RunnableConfig):
     top_k = config["configurable"].get("k") or 2
     ai_message = state["candidate"]
     id = config["configurable"].get("thread_id")
 
-    test_ds = [row for row in ds if row["cp_id"] != id]
-    retriever = BM25Retriever.from_texts([format_example(row) for row in test_ds])
-    
     if not ai_message.tool_calls:
         # We err here. To make more robust, you could loop back
         raise ValueError("Draft agent did not produce a valid code block")
     code = ai_message.tool_calls[0]["args"]["code"]
-    examples_str = "\n".join(
-        [doc.page_content for doc in retriever.invoke(code)[:top_k]]
-    )
-    examples_str = f"""
-You previously solved the following problems in this competition:
-<Examples>
-{examples_str}
-<Examples>
-Approach this new question with similar sophistication."""
-    return {"examples": examples_str} 
\ No newline at end of file
+    # The current problem is filtered out at query time instead of rebuilding the index
+    examples_str = _search(code, id, top_k)
+    return {"examples": examples_str}
+
+async def aretrieve_examples(state: State, config: RunnableConfig):
+    # The first call may build the index, so keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, retrieve_examples, state, config)
@@ -0,0 +1,567 @@
+'''
+Pool of warm sandbox interpreters.
+
+Each worker is a long-lived Python process started from this file. It receives
+(compiled program, stdin) jobs over a pipe, forks a child per job to run it with
+fresh stdio and resource limits, and sends back the output verdict, stderr, exit
+status, timing and peak memory. Forking an already-initialized interpreter is much
+cheaper than starting a new one, which dominates the cost of running short solutions.
+
+This module only depends on the standard library so the worker starts quickly.
+'''
+import atexit
+import io
+import marshal
+import math
+import mmap
+import os
+import pickle
+import queue
+import resource
+import selectors
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import types
+
+_HEADER = struct.Struct("!I")
+_READ_SIZE = 65536
+
+
+def _write_frame(stream, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def _read_exact(stream, n):
+    chunks = []
+    while n:
+        chunk = stream.read(n)
+        if not chunk:
+            raise EOFError("sandbox pipe closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_frame(stream):
+    (size,) = _HEADER.unpack(_read_exact(stream, _HEADER.size))
+    return pickle.loads(_read_exact(stream, size))
+
+
+_code_cache = {}
+_CODE_CACHE_SIZE = 64
+
+
+def _load_code(digest, code):
+    # Candidates are resubmitted unchanged often, so keep recent code objects around
+    loaded = _code_cache.get(digest)
+    if loaded is None:
+        if len(_code_cache) >= _CODE_CACHE_SIZE:
+            del _code_cache[next(iter(_code_cache))]
+        loaded = _code_cache[digest] = marshal.loads(code)
+    return loaded
+
+
+def _exit_status(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _std_stream(fd, template):
+    # Built like CPython's own sys.stdin/stdout/stderr: a buffered binary stream under
+    # a text wrapper that writes through to it, with no newline translation
+    raw = io.FileIO(fd, "r" if fd == 0 else "w", closefd=False)
+    buffered = io.BufferedReader(raw) if fd == 0 else io.BufferedWriter(raw)
+    return io.TextIOWrapper(
+        buffered, encoding=template.encoding, errors=template.errors, newline="\n", write_through=fd != 0,
+    )
+
+
+def _run_child(code):
+    '''Runs in the forked child with fds 0/1/2 already redirected. Never returns.'''
+    # The worker's own streams still carry the interpreter's encoding settings
+    sys.stdin = sys.__stdin__ = _std_stream(0, sys.__stdin__)
+    sys.stdout = sys.__stdout__ = _std_stream(1, sys.__stdout__)
+    sys.stderr = sys.__stderr__ = _std_stream(2, sys.__stderr__)
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.argv = ["-c"]
+    # Run as a real __main__ module, like `python -c`, with none of the worker's exit hooks
+    main = types.ModuleType("__main__")
+    main.__builtins__ = __builtins__
+    sys.modules["__main__"] = main
+    atexit._clear()
+    status = 0
+    try:
+        exec(code, main.__dict__)
+    except SystemExit as e:
+        status = _exit_status(e)
+    except BaseException as e:
+        # Drop this frame so the traceback matches `python -c`
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+    # Interpreter shutdown: wait for non-daemon threads, then run atexit handlers
+    try:
+        threading._shutdown()
+    except SystemExit as e:
+        status = _exit_status(e)
+    except BaseException as e:
+        traceback.print_exception(type(e), e, e.__traceback__)
+        status = status or 1
+    atexit._run_exitfuncs()
+    try:
+        stdout.flush()
+        stderr.flush()
+    except BaseException:
+        status = status or 1
+    os._exit(status & 0xFF)
+
+
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class OutputComparator:
+    """
+    Compares output chunk by chunk against the expected output, with the same result
+    as comparing both after .strip(), but without ever holding the whole output.
+
+    Only the first preview_limit bytes of output are kept. Once the output diverges,
+    mismatch holds the offset into the expected output where it happened. With expected
+    None any output matches, for runs that only check time and memory.
+    """
+
+    def __init__(self, expected, preview_limit: int = 2000):
+        self.checked = expected is not None
+        expected = b"" if expected is None else expected
+        self.expected = expected
+        lo, hi = 0, len(expected)
+        while lo < hi and expected[lo] in _WHITESPACE:
+            lo += 1
+        while hi > lo and expected[hi - 1] in _WHITESPACE:
+            hi -= 1
+        self.pos, self.end = lo, hi
+        self.started = False
+        self.mismatch = None
+        self.preview = bytearray()
+        self.preview_limit = preview_limit
+        self.size = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """Consumes the next output chunk; returns False once the output has diverged."""
+        self.size += len(chunk)
+        if len(self.preview) < self.preview_limit:
+            self.preview += chunk[:self.preview_limit - len(self.preview)]
+        if not self.checked:
+            return True
+        if self.mismatch is not None:
+            return False
+        data = memoryview(chunk)
+        if not self.started:
+            stripped = chunk.lstrip(_WHITESPACE)
+            if not stripped:
+                return True
+            self.started = True
+            data = data[len(chunk) - len(stripped):]
+        n = min(len(data), self.end - self.pos)
+        if data[:n] != self.expected[self.pos:self.pos + n]:
+            self.mismatch = self.pos + self._first_difference(data[:n], self.expected[self.pos:self.pos + n])
+            return False
+        self.pos += n
+        if bytes(data[n:]).strip(_WHITESPACE):
+            # Output goes on past the end of the expected output
+            self.mismatch = self.end
+            return False
+        return True
+
+    def finish(self) -> bool:
+        """Called at end of output; returns True if the whole output matched."""
+        if self.checked and self.mismatch is None and self.pos < self.end:
+            self.mismatch = self.pos
+        return self.mismatch is None
+
+    @staticmethod
+    def _first_difference(a, b) -> int:
+        # Binary search with slice comparisons (memcmp) instead of a byte-by-byte loop
+        lo, hi = 0, len(a)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[lo:mid] != b[lo:mid]:
+                hi = mid
+            else:
+                lo = mid
+        return lo
+
+    def location(self) -> tuple[int, int]:
+        """1-based (line, column) of the mismatch in the expected output."""
+        line, line_start = 1, 0
+        newline = self.expected.find(b"\n", 0, self.mismatch)
+        while newline != -1:
+            line, line_start = line + 1, newline + 1
+            newline = self.expected.find(b"\n", line_start, self.mismatch)
+        return line, self.mismatch - line_start + 1
+
+
+class _StderrPreview:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.size = 0
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        room = self.limit // 2 - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        keep = self.limit - self.limit // 2
+        if chunk and keep:
+            self.tail += chunk[-keep:]
+            del self.tail[:max(0, len(self.tail) - keep)]
+
+    def value(self) -> bytes:
+        omitted = self.size - len(self.head) - len(self.tail)
+        if omitted <= 0:
+            return bytes(self.head + self.tail)
+        return bytes(self.head) + f"\n... [{omitted} bytes omitted] ...\n".encode() + bytes(self.tail)
+
+
+def _kill(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def communicate(pid, stdout_fd, stderr_fd, feed, timeout, comparator):
+    '''
+    Streams the stdout of a child running in its own process group into comparator
+    and collects its stderr until it exits or times out. Like stdout, stderr is bounded
+    by the comparator's preview_limit: its start and end are kept (a traceback ends
+    with the error), and the middle is dropped. feed is None when the child
+    reads stdin from a file, otherwise (stdin pipe fd, bytes to write to it). The child
+    is killed as soon as its output diverges from the expected output. Closes all fds.
+    '''
+    start = time.perf_counter()
+    deadline = start + timeout
+    stderr = _StderrPreview(comparator.preview_limit)
+    sel = selectors.DefaultSelector()
+    stdin_fd, input_data = feed if feed else (None, b"")
+    view = memoryview(input_data)
+    if view:
+        os.set_blocking(stdin_fd, False)
+        sel.register(stdin_fd, selectors.EVENT_WRITE, "stdin")
+    elif stdin_fd is not None:
+        os.close(stdin_fd)
+    sel.register(stdout_fd, selectors.EVENT_READ, "stdout")
+    sel.register(stderr_fd, selectors.EVENT_READ, "stderr")
+    timed_out = diverged = False
+    while len(sel.get_map()) and not diverged:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in sel.select(remaining):
+            if key.data == "stdin":
+                try:
+                    written = os.write(stdin_fd, view[:_READ_SIZE])
+                except BrokenPipeError:
+                    written = len(view)
+                view = view[written:]
+                if not view:
+                    sel.unregister(stdin_fd)
+                    os.close(stdin_fd)
+                continue
+            chunk = os.read(key.fd, _READ_SIZE)
+            if not chunk:
+                sel.unregister(key.fd)
+            elif key.data == "stderr":
+                stderr.feed(chunk)
+            elif not comparator.feed(chunk):
+                diverged = True
+                break
+    for key in list(sel.get_map().values()):
+        sel.unregister(key.fd)
+        if key.data == "stdin":
+            os.close(key.fd)
+    sel.close()
+    if diverged:
+        _kill(pid)
+    # The child may close its stdio and keep running, so keep enforcing the deadline
+    while not timed_out and not diverged:
+        waited, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            break
+        if time.perf_counter() >= deadline:
+            timed_out = True
+        else:
+            time.sleep(0.001)
+    if timed_out:
+        _kill(pid)
+    if timed_out or diverged:
+        _, status, usage = os.wait4(pid, 0)
+    # RLIMIT_CPU kills a program that used up its CPU budget before the wall deadline
+    timed_out = timed_out or (os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXCPU)
+    wall_time = time.perf_counter() - start
+    os.close(stdout_fd)
+    os.close(stderr_fd)
+    matched = comparator.finish()
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout_preview": bytes(comparator.preview),
+        "stdout_size": comparator.size,
+        "stderr": stderr.value(),
+        "timed_out": timed_out,
+        "diverged": diverged,
+        "matched": matched,
+        "mismatch": comparator.location() if not matched else None,
+        "expected_preview": bytes(comparator.expected[:comparator.preview_limit]),
+        "expected_size": len(comparator.expected),
+        "wall_time": wall_time,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "max_rss": usage.ru_maxrss,  # KiB
+    }
+
+
+def set_limits(timeout: float, memory_limit: int = None):
+    '''
+    Applies a CPU time limit just above the wall-clock timeout and, if memory_limit (MB)
+    is given, an address space limit. Called in the child right before it runs.
+    '''
+    cpu = math.ceil(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if memory_limit:
+        limit = int(memory_limit) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def load_expected(job):
+    '''Returns the expected output of a test; files are memory-mapped instead of read.'''
+    if "expected_path" not in job:
+        expected = job["expected"]
+        return expected.encode() if isinstance(expected, str) else expected
+    with open(job["expected_path"], "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def close_expected(expected):
+    if isinstance(expected, mmap.mmap):
+        expected.close()
+
+
+def open_input(job):
+    '''Returns (fd to use as the child's stdin, bytes to feed through a pipe or None).'''
+    if "input_path" in job:
+        return os.open(job["input_path"], os.O_RDONLY), None
+    input_data = job["input"]
+    if isinstance(input_data, str):
+        input_data = input_data.encode()
+    stdin_r, stdin_w = os.pipe()
+    return stdin_r, (stdin_w, input_data)
+
+
+def _run_job(job):
+    code = _load_code(job["digest"], job["code"])
+    expected = load_expected(job)
+    stdin_fd, feed = open_input(job)
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setsid()
+            set_limits(job["timeout"], job.get("memory_limit"))
+            os.dup2(stdin_fd, 0)
+            os.dup2(stdout_w, 1)
+            os.dup2(stderr_w, 2)
+            fds = [stdin_fd, stdout_r, stdout_w, stderr_r, stderr_w, _PROTO_IN, _PROTO_OUT]
+            if feed:
+                fds.append(feed[0])
+            for fd in fds:
+                os.close(fd)
+            _run_child(code)
+        finally:
+            os._exit(1)
+    os.close(stdin_fd)
+    os.close(stdout_w)
+    os.close(stderr_w)
+    comparator = OutputComparator(expected, job["preview_limit"])
+    try:
+        return communicate(pid, stdout_r, stderr_r, feed, job["timeout"], comparator)
+    finally:
+        close_expected(expected)
+
+
+_PROTO_IN = _PROTO_OUT = -1
+
+
+def _worker_main():
+    global _PROTO_IN, _PROTO_OUT
+    # Move the protocol pipes off fds 0/1 so the children can own stdio
+    _PROTO_IN, _PROTO_OUT = os.dup(0), os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    requests = os.fdopen(_PROTO_IN, "rb")
+    responses = os.fdopen(_PROTO_OUT, "wb")
+    while True:
+        try:
+            job = _read_frame(requests)
+        except EOFError:
+            return
+        try:
+            result = _run_job(job)
+        except Exception:
+            result = {"error": traceback.format_exc()}
+        _write_frame(responses, result)
+
+
+class SandboxError(RuntimeError):
+    """Raised when a sandbox worker dies or stops responding."""
+
+
+class SandboxWorker:
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.getcwd(),
+        )
+        self.runs = 0
+
+    def run(self, job: dict) -> dict:
+        self.runs += 1
+        try:
+            _write_frame(self.process.stdin, job)
+            # The worker enforces the job timeout itself; this only guards against a hung worker
+            selector = selectors.DefaultSelector()
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            ready = selector.select(job["timeout"] + 5)
+            selector.close()
+            if not ready:
+                raise SandboxError("sandbox worker stopped responding")
+            result = _read_frame(self.process.stdout)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            raise SandboxError(f"sandbox worker crashed: {e!r}") from e
+        if "error" in result:
+            raise SandboxError(result["error"])
+        return result
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class SandboxPool:
+    """
+    Bounded pool of reusable sandbox workers.
+
+    Workers are started lazily, returned to the pool after each job and replaced
+    after a crash or once they have served max_runs jobs.
+    """
+
+    def __init__(self, size: int, max_runs: int = 200):
+        self.size = size
+        self.max_runs = max_runs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+
+    def _acquire(self) -> SandboxWorker:
+        self._slots.acquire()
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = SandboxWorker()
+            with self._lock:
+                self._workers.add(worker)
+        return worker
+
+    def _release(self, worker: SandboxWorker, healthy: bool):
+        if healthy and worker.alive() and worker.runs < self.max_runs and not self._closed:
+            self._idle.put(worker)
+        else:
+            with self._lock:
+                self._workers.discard(worker)
+            worker.close()
+        self._slots.release()
+
+    def run(
+        self, digest: str, code: bytes, test: dict, timeout: float,
+        memory_limit: int = None, preview_limit: int = 2000,
+    ) -> dict:
+        """
+        Runs a marshalled code object on one test and returns the raw execution result,
+        including wall time, CPU time and peak RSS. digest identifies the code so workers
+        can reuse it. test holds either "input" (bytes) or "input_path", and either
+        "expected" (bytes, or None to accept any output) or "expected_path"; files are
+        read by the worker directly.
+        memory_limit (MB) caps the program's address space.
+        """
+        worker = self._acquire()
+        healthy = False
+        try:
+            job = {
+                **test,
+                "digest": digest,
+                "code": code,
+                "timeout": timeout,
+                "memory_limit": memory_limit,
+                "preview_limit": preview_limit,
+            }
+            result = worker.run(job)
+            healthy = True
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, set()
+        for worker in workers:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """Returns the process-wide sandbox pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from config import max_eval_workers, sandbox_max_runs
+            _pool = SandboxPool(max_eval_workers, sandbox_max_runs)
+            atexit.register(_pool.close)
+        return _pool
+
+
+if __name__ == "__main__":
+    _worker_main()
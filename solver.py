@@ -1,34 +1,100 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from models import State, writePython
-from execution import check_correctness
+from execution import (
+    format_performance, program_digest, record_results, run_incremental, run_staged, run_test_cases,
+)
+from config import evaluation_mode, default_timeout, max_timeout, num_candidates
+from instrument import tracer
+from llm_cache import cached
+from context import compact_messages, render_prefix
+from stress import run_stress
 
 class Solver:
-    def __init__(self, llm: BaseChatModel, prompt: ChatPromptTemplate):
-        self.runnable = prompt | llm.bind_tools([writePython], tool_choice="writePython")
+    _PREFIX_CACHE_SIZE = 64  # problems whose rendered prompt prefix is kept
 
-    def __call__(self, state: State) -> dict:
-        # Our agent only can see the "messages" and will ignore the test info
-        inputs = {"messages": state["messages"]}
+    def __init__(
+        self, llm: BaseChatModel, prompt: ChatPromptTemplate, cache_mode: str = None,
+        num_candidates: int = num_candidates,
+    ):
+        # cache_mode overrides llm_cache_mode from config ("off", "record" or "replay")
+        self.prompt = prompt
+        self.model = cached(llm.bind_tools([writePython], tool_choice="writePython"), cache_mode)
+        self.runnable = prompt | self.model
+        self.num_candidates = num_candidates
+        self._prefixed = OrderedDict()
+        self._prefixed_lock = threading.Lock()
+
+    def _with_examples(self, examples: str) -> Runnable:
+        # The examples are fixed for a problem, so render them into the prompt only once
+        with self._prefixed_lock:
+            runnable = self._prefixed.get(examples)
+            if runnable is None:
+                runnable = render_prefix(self.prompt, examples=examples) | self.model
+                self._prefixed[examples] = runnable
+                while len(self._prefixed) > self._PREFIX_CACHE_SIZE:
+                    self._prefixed.popitem(last=False)
+            else:
+                self._prefixed.move_to_end(examples)
+            return runnable
+
+    def _prepare(self, state: State) -> tuple[Runnable, dict, str]:
+        # Our agent only can see the "messages" and will ignore the test info. Earlier
+        # attempts are condensed so the prompt stays about the same size on every retry
+        inputs = {"messages": compact_messages(state["messages"])}
         has_examples = bool(state.get("examples"))
         output_key = "candidate"  # Used in the draft node
+        runnable = self.runnable
         if has_examples:
             output_key = "messages"
             # Used in the solve node
-            inputs["examples"] = state["examples"]
-        response = self.runnable.invoke(inputs)
+            runnable = self._with_examples(state["examples"])
+            if self.num_candidates > 1:
+                # Candidates wait in "samples" until evaluate picks the best one
+                output_key = "samples"
+        return runnable, inputs, output_key
+
+    def __call__(self, state: State) -> dict:
+        runnable, inputs, output_key = self._prepare(state)
+        with tracer.span("llm", "llm") as span:
+            if output_key == "samples":
+                response = runnable.batch([inputs] * self.num_candidates)
+            else:
+                response = runnable.invoke(inputs)
+            span.set(tokens=message_tokens(response))
+        return {output_key: response}
+
+    async def acall(self, state: State) -> dict:
+        runnable, inputs, output_key = self._prepare(state)
+        with tracer.span("llm", "llm") as span:
+            if output_key == "samples":
+                response = await runnable.abatch([inputs] * self.num_candidates)
+            else:
+                response = await runnable.ainvoke(inputs)
+            span.set(tokens=message_tokens(response))
         return {output_key: response}
 
+def message_tokens(message) -> int:
+    if isinstance(message, list):
+        return sum(message_tokens(m) for m in message)
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens", 0) if usage else 0
+
 def format_tool_message(response: str, ai_message: AIMessage):
     return ToolMessage(
         content=response + "\nMake all fixes using the writePython tool.",
         tool_call_id=ai_message.tool_calls[0]["id"],
     )
 
-def evaluate(state: State):
+def check_submission(state: State, ai_message: AIMessage) -> tuple[dict, float]:
+    '''Runs the tests on one submitted AI message. Returns the state update and its pass rate.'''
     test_cases = state["test_cases"]
-    ai_message: AIMessage = state["messages"][-1]
     if not ai_message.tool_calls:
         return {
             "messages": [
@@ -36,30 +102,83 @@ def evaluate(state: State):
                     content="No code submitted. Please try again using the correct python code."
                 )
             ]
-        }
+        }, -1
     try:
         code = ai_message.tool_calls[0]["args"]["code"]
     except Exception as e:
-        return {"messages": [format_tool_message(repr(e), ai_message)]}
+        return {"messages": [format_tool_message(repr(e), ai_message)]}, -1
     num_test_cases = len(test_cases)
-    succeeded = 0
-    test_results = []
-    # TODO: Multiprocess
-    timeout = 2  # Default timeout value
-    for test_case in test_cases:
-        input_data = test_case["inputs"]
-        expected_output = test_case["outputs"]
-        test_result = check_correctness(code, input_data, expected_output, timeout)
-        test_results.append(test_result)
-        if test_result == "passed":
-            succeeded += 1
+    # Enforce the problem's own limits; hand-entered problems use 100 for "no limit"
+    timeout = min(state.get("runtime_limit") or default_timeout, max_timeout)
+    memory_limit = state.get("memory_limit")
+    history = state.get("test_history") or {}
+    if evaluation_mode == "incremental":
+        previous = history[next(reversed(history))] if history else None
+        results = run_incremental(code, test_cases, timeout, previous, memory_limit=memory_limit)
+    elif evaluation_mode == "staged":
+        results = run_staged(code, test_cases, timeout, memory_limit=memory_limit)
+    else:
+        results = run_test_cases(code, test_cases, timeout, memory_limit=memory_limit)
+    record = {"test_history": {program_digest(code): record_results(test_cases, results)}}
+    test_results = [result.verdict for result in results]
+    succeeded = test_results.count("passed")
     pass_rate = succeeded / num_test_cases if num_test_cases else "N/A"
     if pass_rate == 1:
-        return {"status": "success"}
+        if not (state.get("generator") and state.get("reference")):
+            return {"status": "success", **record}, 1
+        # The fixed tests passed; check the candidate on larger generated inputs too
+        try:
+            stressed, report = run_stress(
+                code, state["generator"], state["reference"], timeout, state.get("max_n"), memory_limit
+            )
+        except ValueError as e:
+            # A broken generator or reference is not the candidate's fault; the fixed tests passed
+            stressed, report = True, str(e)
+        if stressed:
+            return {"status": "success", **record}, 1
+        response = f"All {num_test_cases} tests passed, but the stress test failed. Please respond with updated code.\n{report}"
+        return {"messages": [format_tool_message(response, ai_message)], **record}, succeeded / (num_test_cases + 1)
 
     responses = "\n".join(
         [f"<test id={i}>\n{r}\n</test>" for i, r in enumerate(test_results)]
     )
     response = f"Incorrect submission. Please respond with updated code.\nPass rate: {succeeded}/{num_test_cases}\nResults:\n{responses}"
+    performance = format_performance(results, timeout)
+    if performance:
+        response += "\n" + performance
     formatted_message = format_tool_message(response, ai_message)
-    return {"messages": [formatted_message]} 
\ No newline at end of file
+    return {"messages": [formatted_message], **record}, pass_rate if num_test_cases else 0
+
+def evaluate(state: State):
+    samples = state.get("samples")
+    if samples:
+        return evaluate_samples(state, samples)
+    update, _ = check_submission(state, state["messages"][-1])
+    return update
+
+def evaluate_samples(state: State, samples: list[AIMessage]) -> dict:
+    '''
+    Evaluates all candidates from the solve node in parallel and keeps one: the first
+    to pass every test, otherwise the one with the highest pass rate (earliest on ties).
+    Only the kept candidate and its feedback are added to the conversation.
+    '''
+    executor = ThreadPoolExecutor(max_workers=len(samples))
+    futures = {executor.submit(check_submission, state, sample): i for i, sample in enumerate(samples)}
+    best = None
+    try:
+        for future in as_completed(futures):
+            update, pass_rate = future.result()
+            i = futures[future]
+            if best is None or (pass_rate, -i) > (best[2], -best[0]):
+                best = (i, update, pass_rate)
+            if pass_rate == 1:
+                break
+    finally:
+        # Candidates still running only fill the verdict cache; nobody waits for them
+        executor.shutdown(wait=False, cancel_futures=True)
+    i, update, _ = best
+    return {**update, "messages": [samples[i]] + update.get("messages", []), "samples": []}
+
+async def aevaluate(state: State):
+    # Test execution blocks, so keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, evaluate, state)
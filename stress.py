@@ -0,0 +1,162 @@
+'''
+Stress testing against generated inputs.
+
+A generator program reads "n seed" from stdin and prints one test input of size n. A
+trusted reference solution (brute force or known-good) produces the expected output
+for each generated input. Both are cached on disk by content hash, so they only run
+once per (generator, n, seed) and (reference, input). The candidate is then run on
+inputs growing geometrically up to the problem's stated maximum, and its CPU time is
+fitted against n to estimate how its runtime scales.
+'''
+import hashlib
+import math
+import os
+import subprocess
+import sys
+from atomicfile import atomic_write
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    max_eval_workers, stress_store_path, stress_max_n, stress_points, stress_seed, stress_reference_timeout,
+)
+from execution import TestResult, normalize_program, run_test, run_test_cases
+from sandbox import set_limits
+from testcases import test_case_from_files
+
+_MIN_MEASURABLE = 0.005  # seconds of CPU above the smallest input before a point is fitted
+
+def stress_sizes(max_n: int, points: int = stress_points, ratio: int = 4) -> list[int]:
+    '''Input sizes ending at max_n, each ratio times the previous one.'''
+    return sorted(set(max(1, max_n // ratio ** i) for i in range(points)))
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class _HelperFailed(Exception):
+    pass
+
+def _run_to_file(program: str, stdin, output_path: str, timeout: float) -> str:
+    '''Runs a trusted helper program with its stdout going to output_path. Returns an error or None.'''
+    try:
+        with atomic_write(output_path) as output:
+            completed = subprocess.run(
+                [sys.executable, "-c", program],
+                stdin=stdin if not isinstance(stdin, bytes) else None,
+                input=stdin if isinstance(stdin, bytes) else None,
+                stdout=output,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+                preexec_fn=lambda: set_limits(timeout),
+            )
+            if completed.returncode != 0:
+                lines = completed.stderr.decode(errors="replace").strip().splitlines()
+                raise _HelperFailed(lines[-1] if lines else f"exit status {completed.returncode}")
+    except subprocess.TimeoutExpired:
+        return "timed out"
+    except _HelperFailed as e:
+        return str(e)
+    return None
+
+def generate_input(generator: str, n: int, seed: int, store_path: str = stress_store_path) -> str:
+    '''Returns the path of the generated input for (generator, n, seed), generating it once.'''
+    directory = os.path.join(store_path, "inputs", _digest(normalize_program(generator))[:16])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{n}-{seed}.in")
+    if not os.path.exists(path):
+        error = _run_to_file(generator, f"{n} {seed}\n".encode(), path, stress_reference_timeout)
+        if error:
+            raise ValueError(f"generator failed for n={n}: {error}")
+    return path
+
+def reference_output(reference: str, input_path: str, store_path: str = stress_store_path) -> str:
+    '''Returns the path of the reference output for an input, or None if the reference is too slow.'''
+    h = hashlib.sha256()
+    with open(input_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            h.update(chunk)
+    input_digest = h.hexdigest()
+    directory = os.path.join(store_path, "outputs", _digest(normalize_program(reference))[:16])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{input_digest}.out")
+    # Remembered so a slow brute force is not rerun on every evaluation
+    slow_marker = path + ".slow"
+    if os.path.exists(slow_marker):
+        return None
+    if not os.path.exists(path):
+        with open(input_path, "rb") as stdin:
+            error = _run_to_file(reference, stdin, path, stress_reference_timeout)
+        if error == "timed out":
+            open(slow_marker, "w").close()
+            return None
+        if error:
+            raise ValueError(f"reference solution failed: {error}")
+    return path
+
+def scaling_exponent(sizes: list[int], results: list[TestResult]) -> float:
+    '''
+    Least-squares slope of log(CPU time) against log(n) over the passing runs, after
+    subtracting the time taken on the smallest input (interpreter and I/O setup).
+    Returns None when fewer than two runs took measurably long.
+    '''
+    timed = [(n, r.cpu_time) for n, r in zip(sizes, results) if r.cpu_time is not None and r.verdict == "passed"]
+    if len(timed) < 2:
+        return None
+    baseline = timed[0][1]
+    points = [(math.log(n), math.log(t - baseline)) for n, t in timed[1:] if t - baseline > _MIN_MEASURABLE]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+def run_stress(
+    program: str,
+    generator: str,
+    reference: str,
+    timeout: float,
+    max_n: int = None,
+    memory_limit: int = None,
+    seed: int = stress_seed,
+) -> tuple[bool, str]:
+    '''
+    Runs the candidate on generated inputs up to max_n and compares it with the reference.
+    Inputs the reference is too slow for are still run, checking only time and memory,
+    since that is where slow candidates fail. Returns whether every run passed and a
+    report for the model. Raises ValueError if the generator or reference is broken, or
+    if the reference was too slow to check any output.
+    '''
+    max_n = max_n or stress_max_n
+    sizes, test_cases, unchecked = [], [], []
+    for n in stress_sizes(max_n):
+        input_path = generate_input(generator, n, seed)
+        output_path = reference_output(reference, input_path)
+        if output_path is None:
+            unchecked.append((n, input_path))
+            continue
+        sizes.append(n)
+        test_cases.append(test_case_from_files(input_path, output_path))
+    results = run_test_cases(program, test_cases, timeout, memory_limit=memory_limit)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_eval_workers, len(unchecked)))) as executor:
+        unchecked_results = list(executor.map(
+            lambda item: run_test(program, {"input_path": item[1], "expected": None}, timeout, memory_limit),
+            unchecked,
+        ))
+    runs = [(n, result, True) for n, result in zip(sizes, results)]
+    runs += [(n, result, False) for (n, _), result in zip(unchecked, unchecked_results)]
+    runs.sort(key=lambda run: run[0])
+    lines = [f"Stress test on generated inputs (n up to {max_n}, time limit {timeout:g}s):"]
+    for n, result, checked in runs:
+        timing = f" ({result.cpu_time:.2f}s CPU)" if result.cpu_time is not None else ""
+        verdict = result.verdict[:300]
+        if not checked and result.verdict == "passed":
+            verdict = "finished within the limits (output not checked: reference solution too slow)"
+        lines.append(f"n={n}{timing}: {verdict}")
+    exponent = scaling_exponent([n for n, _, _ in runs], [result for _, result, _ in runs])
+    if exponent is not None:
+        lines.append(f"CPU time grows roughly as n^{exponent:.1f}.")
+    passed = all(result.verdict == "passed" for _, result, _ in runs)
+    if passed and not test_cases:
+        raise ValueError("reference solution too slow to check any generated input")
+    return passed, "\n".join(lines)
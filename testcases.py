@@ -0,0 +1,80 @@
+'''
+File-backed test cases.
+
+State only holds references to test files (paths, size and a content digest), never
+their contents, so checkpoints stay small and the sandbox reads input straight from
+the file. Test cases typed in by the user are written to a content-addressed store.
+Test data is read as text, as `open(path)` would: files with Windows line endings are
+stored again with "\n" endings, since the sandbox compares output byte for byte.
+'''
+import hashlib
+import os
+from atomicfile import atomic_write
+from models import TestCase
+from config import test_store_path
+
+_CHUNK_SIZE = 1 << 20
+
+def normalize_newlines(data):
+    # Universal newlines, as in text mode: "\r\n" and a lone "\r" both become "\n"
+    if isinstance(data, str):
+        return data.replace("\r\n", "\n").replace("\r", "\n")
+    return data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+def _hash_file(h, path: str) -> bool:
+    '''Adds the file to h and returns whether it contains a carriage return.'''
+    has_cr = False
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(_CHUNK_SIZE), b""):
+            h.update(chunk)
+            has_cr = has_cr or b"\r" in chunk
+    return has_cr
+
+def _read_text(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return normalize_newlines(file.read())
+
+def test_case_from_files(input_path: str, output_path: str) -> TestCase:
+    h = hashlib.sha256()
+    has_cr = _hash_file(h, input_path)
+    h.update(b"\0")
+    has_cr = _hash_file(h, output_path) or has_cr
+    if has_cr:
+        return _store(_read_text(input_path), _read_text(output_path), test_store_path)
+    return {
+        "input_path": os.path.abspath(input_path),
+        "output_path": os.path.abspath(output_path),
+        "input_size": os.path.getsize(input_path),
+        "digest": h.hexdigest(),
+    }
+
+def test_case_from_strings(inputs: str, outputs: str, store_path: str = test_store_path) -> TestCase:
+    return _store(normalize_newlines(inputs).encode(), normalize_newlines(outputs).encode(), store_path)
+
+def _store(inputs: bytes, outputs: bytes, store_path: str) -> TestCase:
+    os.makedirs(store_path, exist_ok=True)
+    digest = hashlib.sha256(inputs + b"\0" + outputs).hexdigest()
+    input_path = os.path.join(store_path, digest + ".in")
+    output_path = os.path.join(store_path, digest + ".out")
+    for path, content in ((input_path, inputs), (output_path, outputs)):
+        if not os.path.exists(path):
+            with atomic_write(path) as file:
+                file.write(content)
+    return {
+        "input_path": os.path.abspath(input_path),
+        "output_path": os.path.abspath(output_path),
+        "input_size": len(inputs),
+        "digest": digest,
+    }
+
+def as_test_case(test_case: dict) -> TestCase:
+    '''Accepts legacy {"inputs", "outputs"} dicts holding contents and stores them as files.'''
+    if "input_path" in test_case:
+        return test_case
+    return test_case_from_strings(test_case["inputs"], test_case["outputs"])
+
+def read_preview(path: str, limit: int = 200) -> str:
+    with open(path, "rb") as file:
+        data = file.read(limit + 1)
+    text = data[:limit].decode(errors="replace")
+    return text + "..." if len(data) > limit else text
@@ -1,9 +1,9 @@
 import re
-import requests
+import shutil
 import zipfile
 import os
-import datasets
-from config import usaco_url, zip_path, extract_path
+from config import usaco_url, zip_path, extract_path, usaco_tests_path
+from testcases import read_preview, test_case_from_files, test_case_from_strings
 
 def filter_python_code(output: str) -> str:
     """
@@ -39,8 +39,8 @@ def _hide_test_cases(inputs):
     if "test_cases" in copied:
         copied["test_cases"] = [
             {
-                "inputs": "..." if len(tc["inputs"]) > 200 else tc["inputs"],
-                "outputs": "..." if len(tc["outputs"]) > 200 else tc["outputs"]
+                "inputs": read_preview(tc["input_path"]),
+                "outputs": read_preview(tc["output_path"])
             }
             for tc in copied["test_cases"]
         ]
@@ -49,21 +49,19 @@ def _hide_test_cases(inputs):
     return copied
 
 def get_problem_ds(problem):
-    test_path = "/Users/stevenyu/programmingsolver/usaco_data/datasets/usaco_v3/tests/" + problem["cp_id"] + "/"
+    test_path = os.path.join(usaco_tests_path, problem["cp_id"]) + "/"
     test_cases = []
     for i in range(int(problem["num_tests"])):
-        test_cases.append({"inputs":"", "outputs":""})
+        # Only file references go into the state; the sandbox reads the files itself
         inFN = test_path + "I." + str(i+1)
         outFN = test_path + "O." + str(i+1)
-        with open(inFN, "r") as file:
-            test_cases[i]["inputs"] = file.read()
-        with open(outFN, "r") as file:
-            test_cases[i]["outputs"] = file.read()
+        test_cases.append(test_case_from_files(inFN, outFN))
     return {
         "title": problem["cp_id"],
         "messages": [("user", problem["description"])],
         "test_cases": test_cases,
         "runtime_limit": problem["runtime_limit"],
+        "memory_limit": problem.get("memory_limit"),
         "status": "in_progress",
     } 
 
@@ -84,31 +82,52 @@ def get_problem():
     test_cases = []
     for i in range(test_case_num):
         print("Test Case " + str(i+1) + ":")
-        test_cases.append({"inputs":"", "outputs":""})
-        test_cases[i]["inputs"] = input("Please input the input text: \n")
-        test_cases[i]["outputs"] = input("Please input the output text: \n")
+        inputs = input("Please input the input text: \n")
+        outputs = input("Please input the output text: \n")
+        test_cases.append(test_case_from_strings(inputs, outputs))
     print("\n\n")
     runtime_limit = int(input("Please input the runtime limit (if none, input 100): "))
-    return {
+    problem = {
         "title": title,
         "messages": [("user", description)],
         "test_cases": test_cases,
         "runtime_limit": runtime_limit,
         "status": "in_progress",
     }
+    # Optional stress test: a generator reading "n seed" and a trusted reference solution
+    generator_path = input("Path to an input generator program (leave empty to skip stress testing): ").strip()
+    if generator_path:
+        reference_path = input("Path to a reference solution: ").strip()
+        with open(generator_path) as file:
+            problem["generator"] = file.read()
+        with open(reference_path) as file:
+            problem["reference"] = file.read()
+        problem["max_n"] = int(input("Largest input size n allowed by the constraints: "))
+    return problem
 
 #load sample of usaco problems
 def get_dataset_standard():
+    # Imported here because they are slow to import and only needed on first load
+    import datasets
     if not os.path.exists(extract_path):
-        response = requests.get(usaco_url)
-        with open(zip_path, "wb") as file:
-            file.write(response.content)
-        
+        import requests
+        # Stream the archive to disk instead of holding it in memory
+        with requests.get(usaco_url, stream=True) as response:
+            response.raise_for_status()
+            with open(zip_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    file.write(chunk)
+
+        # Extract next to the final path so an interrupted run never leaves a partial dataset
+        tmp_path = extract_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(extract_path)
+            zip_ref.extractall(tmp_path)
+        os.replace(tmp_path, extract_path)
 
         os.remove(zip_path)
 
+    # Arrow files are memory-mapped, so rows are only read when accessed
     ds = datasets.load_from_disk(os.path.join(extract_path, "usaco_v3_sampled_with_tests"))
     return ds
 